@@ -0,0 +1,193 @@
+# 規模テスト用の合成データ生成（seed が同じなら同じデータになる）
+#   cd app && python -m benchmarks.dataset --campsites 1000000 --users 10000 --database-url sqlite+aiosqlite:///synthetic.db
+# 本番と同じ分布に近づける: 47都道府県（件数に偏りあり）、人気に偏りのあるタグ、対数正規の料金
+import argparse
+import asyncio
+import math
+import random
+import sys
+import time
+from collections import namedtuple
+from typing import Iterator, List, Optional
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from database.base import Base
+from models.campsite import DBCampsite
+from models.tag import DBCampsiteTag
+from models.user import DBUser
+from core.etag import bump_catalog_version
+from core.facets import rebuild_facets
+from core.geo import geohash_for
+from core.hashing import password_hasher
+from core.search import index_new_campsites
+from core.tags import get_tag_ids
+
+Prefecture = namedtuple("Prefecture", "short full lat lon weight")
+
+# 県庁所在地付近の座標と、キャンプ場の多さの目安（相対値）
+PREFECTURES = [
+    Prefecture("北海道", "北海道", 43.06, 141.35, 12), Prefecture("青森", "青森県", 40.82, 140.74, 3),
+    Prefecture("岩手", "岩手県", 39.70, 141.15, 3), Prefecture("宮城", "宮城県", 38.27, 140.87, 3),
+    Prefecture("秋田", "秋田県", 39.72, 140.10, 2), Prefecture("山形", "山形県", 38.24, 140.36, 3),
+    Prefecture("福島", "福島県", 37.75, 140.47, 4), Prefecture("茨城", "茨城県", 36.34, 140.45, 3),
+    Prefecture("栃木", "栃木県", 36.57, 139.88, 5), Prefecture("群馬", "群馬県", 36.39, 139.06, 5),
+    Prefecture("埼玉", "埼玉県", 35.86, 139.65, 3), Prefecture("千葉", "千葉県", 35.61, 140.12, 5),
+    Prefecture("東京", "東京都", 35.69, 139.69, 2), Prefecture("神奈川", "神奈川県", 35.45, 139.64, 3),
+    Prefecture("新潟", "新潟県", 37.90, 139.02, 4), Prefecture("富山", "富山県", 36.70, 137.21, 2),
+    Prefecture("石川", "石川県", 36.59, 136.63, 2), Prefecture("福井", "福井県", 36.07, 136.22, 2),
+    Prefecture("山梨", "山梨県", 35.66, 138.57, 7), Prefecture("長野", "長野県", 36.65, 138.18, 9),
+    Prefecture("岐阜", "岐阜県", 35.39, 136.72, 5), Prefecture("静岡", "静岡県", 34.98, 138.38, 7),
+    Prefecture("愛知", "愛知県", 35.18, 136.91, 3), Prefecture("三重", "三重県", 34.73, 136.51, 4),
+    Prefecture("滋賀", "滋賀県", 35.00, 135.87, 3), Prefecture("京都", "京都府", 35.02, 135.76, 2),
+    Prefecture("大阪", "大阪府", 34.69, 135.52, 1), Prefecture("兵庫", "兵庫県", 34.69, 135.18, 4),
+    Prefecture("奈良", "奈良県", 34.69, 135.83, 2), Prefecture("和歌山", "和歌山県", 34.23, 135.17, 3),
+    Prefecture("鳥取", "鳥取県", 35.50, 134.24, 2), Prefecture("島根", "島根県", 35.47, 133.05, 2),
+    Prefecture("岡山", "岡山県", 34.66, 133.93, 3), Prefecture("広島", "広島県", 34.40, 132.46, 3),
+    Prefecture("山口", "山口県", 34.19, 131.47, 2), Prefecture("徳島", "徳島県", 34.07, 134.56, 2),
+    Prefecture("香川", "香川県", 34.34, 134.04, 1), Prefecture("愛媛", "愛媛県", 33.84, 132.77, 2),
+    Prefecture("高知", "高知県", 33.56, 133.53, 2), Prefecture("福岡", "福岡県", 33.61, 130.42, 3),
+    Prefecture("佐賀", "佐賀県", 33.25, 130.30, 1), Prefecture("長崎", "長崎県", 32.74, 129.87, 2),
+    Prefecture("熊本", "熊本県", 32.79, 130.74, 4), Prefecture("大分", "大分県", 33.24, 131.61, 3),
+    Prefecture("宮崎", "宮崎県", 31.91, 131.42, 2), Prefecture("鹿児島", "鹿児島県", 31.56, 130.56, 3),
+    Prefecture("沖縄", "沖縄県", 26.21, 127.68, 2),
+]
+PREFECTURE_WEIGHTS = [p.weight for p in PREFECTURES]
+
+# 人気順（Zipf 風に 1 / 順位^1.1 の重みで選ぶ）
+TAGS = [
+    "ペット可", "オートサイト", "川", "湖", "森林", "温泉", "星空", "海", "電源あり", "手ぶらOK",
+    "区画サイト", "フリーサイト", "釣り", "ファミリー", "コテージ", "バンガロー", "グランピング", "富士山",
+    "高原", "焚き火OK", "シャワー", "売店", "ソロキャンプ", "カヌー", "登山口", "紅葉", "雪中キャンプ",
+    "ドッグラン", "直火OK", "無料",
+]
+TAG_WEIGHTS = [1 / (rank + 1) ** 1.1 for rank in range(len(TAGS))]
+TAG_COUNTS = [0, 1, 2, 3, 4, 5, 6]
+TAG_COUNT_WEIGHTS = [5, 15, 25, 25, 15, 10, 5]
+
+NAME_PREFIXES = ["白樺", "あさぎり", "みずなら", "ほたる", "星降る", "湖畔の", "森の", "風の", "渓谷", "高原", "くぬぎ", "しらかば", "清流", "朝霧", "山桜", "かもしか", "つつじ", "月見"]
+NAME_NATURE = ["の森", "の里", "の丘", "の谷", "の湖", "の郷", "の杜", "の浜", "平", "ヶ原", "台", ""]
+NAME_SUFFIXES = ["キャンプ場", "オートキャンプ場", "キャンプフィールド", "野営場", "ファミリーキャンプ村", "グランピングリゾート", "キャンプベース"]
+AREAS = ["北部", "中部", "南部", "東部", "西部", "山間部", "沿岸部"]
+FEATURES = ["川のせせらぎが聞こえる", "満天の星空が楽しめる", "温泉まで車で10分の", "区画が広くゆったりした", "初心者にもやさしい", "湖が目の前の", "林間サイト中心の", "富士山を望む", "海まで歩いて行ける", "紅葉の名所に近い"]
+
+def _name(rng: random.Random) -> str:
+    return rng.choice(NAME_PREFIXES) + rng.choice(NAME_NATURE) + rng.choice(NAME_SUFFIXES)
+
+def _price(rng: random.Random) -> tuple:
+    # 5% は無料。それ以外は中央値 3,000 円前後の対数正規分布で、500 円単位に丸める
+    if rng.random() < 0.05:
+        return 0, 0
+    price_min = min(30000, max(500, int(round(rng.lognormvariate(math.log(3000), 0.6) / 500)) * 500))
+    price_max = min(60000, int(round(price_min * (1 + rng.lognormvariate(math.log(0.6), 0.7)) / 500)) * 500)
+    return price_min, max(price_min, price_max)
+
+def generate_campsites(count: int, seed: int = 0, start_id: int = 1) -> Iterator[dict]:
+    # 1行ずつ生成する（メモリに全件を持たない）。tags はタグ名のリスト
+    rng = random.Random(seed)
+    for campsite_id in range(start_id, start_id + count):
+        pref = rng.choices(PREFECTURES, PREFECTURE_WEIGHTS)[0]
+        price_min, price_max = _price(rng)
+        tags = []
+        for tag in rng.choices(TAGS, TAG_WEIGHTS, k=rng.choices(TAG_COUNTS, TAG_COUNT_WEIGHTS)[0]):
+            if tag not in tags:
+                tags.append(tag)
+        pet_friendly = "ペット可" in tags or rng.random() < 0.25
+        latitude = round(min(45.5, max(24.0, rng.gauss(pref.lat, 0.35))), 6)
+        longitude = round(min(146.0, max(122.9, rng.gauss(pref.lon, 0.35))), 6)
+        name = _name(rng)
+        yield {
+            "id": campsite_id,
+            "name": name,
+            "description": f"{rng.choice(FEATURES)}{name}です。{rng.choice(FEATURES)}サイトもあります。",
+            "location": pref.full + rng.choice(AREAS),
+            "prefecture": pref.short,
+            "price_min": price_min,
+            "price_max": price_max,
+            "pet_friendly": pet_friendly,
+            "latitude": latitude,
+            "longitude": longitude,
+            "geohash": geohash_for(latitude, longitude),
+            "tags": tags,
+        }
+
+def _batches(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def load_dataset(db: AsyncSession, campsites: int, users: int = 0, seed: int = 0, batch_size: int = 5000, search_index: bool = False, password: str = "password", progress=None) -> dict:
+    # id を自前で振り、本体・タグをバッチごとの executemany（Core の INSERT）で入れる
+    start_id = ((await db.execute(select(func.max(DBCampsite.id)))).scalar() or 0) + 1
+    tag_ids = await get_tag_ids(db, TAGS)
+    table = DBCampsite.__table__
+    loaded = 0
+    for batch in _batches(generate_campsites(campsites, seed, start_id), batch_size):
+        await db.execute(insert(table), [{k: v for k, v in row.items() if k != "tags"} for row in batch])
+        tag_rows = [
+            {"campsite_id": row["id"], "tag_id": tag_ids[name], "position": i}
+            for row in batch
+            for i, name in enumerate(row["tags"])
+        ]
+        if tag_rows:
+            await db.execute(insert(DBCampsiteTag), tag_rows)
+        if search_index:
+            await index_new_campsites(db, [(row["id"], row["name"], row["description"], row["location"]) for row in batch])
+        await db.commit()
+        loaded += len(batch)
+        if progress:
+            progress(loaded)
+
+    if users:
+        # bcrypt は1回だけ計算して全ユーザーで共有する
+        hashed = password_hasher.hash_sync(password)
+        start_user = ((await db.execute(select(func.max(DBUser.id)))).scalar() or 0) + 1
+        for first in range(start_user, start_user + users, batch_size):
+            last = min(first + batch_size, start_user + users)
+            await db.execute(insert(DBUser.__table__), [{"id": i, "username": f"user{i:07d}", "hashed_password": hashed} for i in range(first, last)])
+            await db.commit()
+
+    # ファセットは全件から作り直す（行ごとの差分更新より速い）
+    await rebuild_facets(db)
+    await bump_catalog_version(db)
+    await db.commit()
+    return {"campsites": loaded, "users": users, "first_id": start_id}
+
+async def _main(args) -> None:
+    engine = create_async_engine(args.database_url, future=True)
+    if args.create_tables:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    started = time.perf_counter()
+
+    def progress(n):
+        print(f"\r{n:,} campsites ({n / (time.perf_counter() - started):,.0f} rows/s)", end="", file=sys.stderr)
+
+    async with session_maker() as db:
+        if engine.dialect.name == "sqlite":
+            # 生成データなので耐障害性より投入速度を優先する
+            await db.execute(text("PRAGMA synchronous=OFF"))
+        report = await load_dataset(db, args.campsites, args.users, args.seed, args.batch_size, args.search_index, args.password, progress)
+    await engine.dispose()
+    print(f"\nloaded {report['campsites']:,} campsites and {report['users']:,} users in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="generate a synthetic campsite dataset")
+    parser.add_argument("--campsites", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///synthetic.db")
+    parser.add_argument("--create-tables", action="store_true", help="create missing tables before loading")
+    parser.add_argument("--search-index", action="store_true", help="also build the keyword search index (much larger)")
+    parser.add_argument("--password", default="password", help="password for every generated user")
+    asyncio.run(_main(parser.parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# API の負荷・レイテンシ計測（SQLite にデータを投入し、httpx で各ルートへ並列にリクエストする）
+#   cd app && PYTHONPATH=.. python -m benchmarks.load --campsites 5000 --users 100
+#   ベースラインの保存:  ... --save-baseline
+#   以降の実行はベースラインと比較し、劣化があれば終了コード 1 を返す
+#   --database-url で指定した DB は空である必要がある（作り直すときだけ --reset-database。既存データは消える）
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from typing import List
+import httpx
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from database.base import Base
+from database.session import get_db, get_read_db
+from models.campsite import DBCampsite
+from models.user import DBUser
+from schemas.campsite import CampsiteCreate
+from core.bulk import insert_batch
+from core.cache import campsite_cache, catalog_watermark
+from core.hashing import password_hasher
+from core.security import create_access_token
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+PREFECTURES = ["北海道", "長野", "山梨", "静岡", "岐阜", "栃木", "千葉", "熊本"]
+TAGS = ["川", "湖", "海", "温泉", "星空", "森林", "ペット可", "オートサイト"]
+PASSWORD = "benchpass"
+
+# name: ルート名, method, build(rng, ctx) -> (path, kwargs)
+Scenario = namedtuple("Scenario", "name method build admin")
+
+def _campsite_body(rng: random.Random, i: int) -> dict:
+    prefecture = rng.choice(PREFECTURES)
+    price_min = rng.randrange(1000, 6000, 500)
+    return {
+        "name": f"ベンチキャンプ場{i}",
+        "description": f"{prefecture}の{rng.choice(TAGS)}が近いキャンプ場です。",
+        "location": f"{prefecture}県",
+        "prefecture": prefecture,
+        "price_min": price_min,
+        "price_max": price_min + rng.randrange(0, 5000, 500),
+        "pet_friendly": rng.random() < 0.5,
+        "tags": rng.sample(TAGS, rng.randint(0, 3)),
+        "latitude": round(rng.uniform(31.0, 44.0), 5),
+        "longitude": round(rng.uniform(130.0, 145.0), 5),
+    }
+
+SCENARIOS = [
+    Scenario("GET /api/campsites", "GET", lambda rng, ctx: ("/api/campsites", {}), False),
+    Scenario("GET /api/campsites?filters", "GET", lambda rng, ctx: ("/api/campsites", {"params": {"prefecture": rng.choice(PREFECTURES), "pet_friendly": "true", "tag": rng.choice(TAGS)}}), False),
+    Scenario("GET /api/campsites?keyword", "GET", lambda rng, ctx: ("/api/campsites", {"params": {"keyword": rng.choice(PREFECTURES), "sort": "relevance"}}), False),
+    Scenario("GET /api/campsites/{id}", "GET", lambda rng, ctx: (f"/api/campsites/{rng.choice(ctx['ids'])}", {}), False),
+    Scenario("GET /api/campsites/facets", "GET", lambda rng, ctx: ("/api/campsites/facets", {"params": {"prefecture": rng.choice(PREFECTURES)}}), False),
+    Scenario("GET /api/campsites/nearby", "GET", lambda rng, ctx: ("/api/campsites/nearby", {"params": {"lat": rng.uniform(33.0, 42.0), "lon": rng.uniform(131.0, 142.0), "radius_km": 50}}), False),
+    Scenario("POST /api/admin/token", "POST", lambda rng, ctx: ("/api/admin/token", {"data": {"username": rng.choice(ctx["users"]), "password": PASSWORD}}), False),
+    Scenario("POST /api/admin/campsites", "POST", lambda rng, ctx: ("/api/admin/campsites", {"json": _campsite_body(rng, rng.randrange(10 ** 9))}), True),
+    Scenario("PATCH /api/admin/campsites/{id}", "PATCH", lambda rng, ctx: (f"/api/admin/campsites/{rng.choice(ctx['ids'])}", {"json": {"price_min": rng.randrange(1000, 6000, 500)}}), True),
+]
+
+async def seed(session_maker, campsites: int, users: int, seed_value: int) -> dict:
+    rng = random.Random(seed_value)
+    ids = []
+    async with session_maker() as db:
+        # 本番と同じ一括登録の経路（タグ・検索索引・ファセットも作られる）
+        for start in range(0, campsites, 500):
+            batch = [CampsiteCreate(**_campsite_body(rng, i)) for i in range(start, min(start + 500, campsites))]
+            ids.extend(await insert_batch(db, batch))
+        # ハッシュ計算は1回だけにして全ユーザーで共有する（ログインの検証コストは本番と同じ）
+        hashed = password_hasher.hash_sync(PASSWORD)
+        # 管理APIのトークン用に benchadmin を必ず作る
+        names = ["benchadmin"] + [f"benchuser{i}" for i in range(users)]
+        await db.execute(insert(DBUser), [{"username": n, "hashed_password": hashed} for n in names])
+        await db.commit()
+    return {"ids": ids, "users": names}
+
+def percentile(values: List[float], p: float) -> float:
+    # nearest-rank 法
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, ctx: dict, requests: int, concurrency: int, rng: random.Random) -> dict:
+    latencies = []
+    errors = 0
+    calls = [scenario.build(rng, ctx) for _ in range(requests)]
+    headers = ctx["headers"] if scenario.admin else {}
+
+    async def worker(queue: List):
+        nonlocal errors
+        while queue:
+            path, kwargs = queue.pop()
+            start = time.perf_counter()
+            resp = await client.request(scenario.method, path, headers=headers, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if resp.status_code >= 400:
+                errors += 1
+
+    queue = list(reversed(calls))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(queue) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+class DatabaseNotEmpty(Exception):
+    pass
+
+async def prepare_database(engine, reset: bool) -> None:
+    # テーブルを作り直すのは reset=True のときだけ。それ以外はデータの入った DB には投入しない（既存のデータを消さない）
+    async with engine.begin() as conn:
+        if reset:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        for table in (DBCampsite.__table__, DBUser.__table__):
+            if (await conn.execute(select(table.c.id).limit(1))).first() is not None:
+                raise DatabaseNotEmpty(f"table {table.name} already contains data (use --reset-database to drop and recreate all tables)")
+
+async def run(campsites: int, users: int, requests: int, concurrency: int, seed_value: int = 0, only: List[str] = None, cold_cache: bool = False, database_url: str = None, reset_database: bool = False) -> dict:
+    from main import app
+
+    tmpdir = None
+    if database_url is None:
+        # 自分で作った一時 DB は常に作り直してよい
+        tmpdir = tempfile.mkdtemp(prefix="campsite-bench-")
+        database_url = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        reset_database = True
+    engine = create_async_engine(database_url, future=True)
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    try:
+        await prepare_database(engine, reset_database)
+    except BaseException:
+        await engine.dispose()
+        raise
+
+    async def bench_get_db():
+        async with session_maker() as session:
+            yield session
+
+    saved = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = bench_get_db
+    app.dependency_overrides.pop(get_read_db, None)
+    await campsite_cache.clear()
+    catalog_watermark.reset()
+    try:
+        ctx = await seed(session_maker, campsites, users, seed_value)
+        ctx["headers"] = {"Authorization": f"Bearer {create_access_token({'sub': 'benchadmin'})}"}
+        results = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for scenario in SCENARIOS:
+                if only and scenario.name not in only:
+                    continue
+                if cold_cache:
+                    await campsite_cache.clear()
+                results[scenario.name] = await run_scenario(client, scenario, ctx, requests, concurrency, random.Random(seed_value))
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(saved)
+        await engine.dispose()
+        if tmpdir:
+            for name in os.listdir(tmpdir):
+                os.remove(os.path.join(tmpdir, name))
+            os.rmdir(tmpdir)
+    return {
+        "config": {"campsites": campsites, "users": users, "requests": requests, "concurrency": concurrency, "seed": seed_value, "cold_cache": cold_cache},
+        "routes": results,
+    }
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    # p95 が tolerance 以上悪化、またはスループットが tolerance 以上低下したルートを返す
+    regressions = []
+    for name, now in current["routes"].items():
+        base = baseline.get("routes", {}).get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and now["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f}ms -> {now['p95_ms']:.1f}ms")
+        if base["rps"] and now["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {base['rps']:.0f} -> {now['rps']:.0f}")
+        if now["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: errors {base.get('errors', 0)} -> {now['errors']}")
+    return regressions
+
+def format_report(current: dict, baseline: dict = None) -> str:
+    lines = [f"{'route':<36} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>4} {'p95 vs base':>12}"]
+    for name, r in current["routes"].items():
+        base = (baseline or {}).get("routes", {}).get(name)
+        diff = f"{(r['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}%" if base and base["p95_ms"] else "-"
+        lines.append(f"{name:<36} {r['rps']:>8.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>4} {diff:>12}")
+    return "\n".join(lines)
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="campsite API load benchmark")
+    parser.add_argument("--campsites", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--route", action="append", help="run only the named route (repeatable)")
+    parser.add_argument("--cold-cache", action="store_true", help="clear the response cache before each route")
+    parser.add_argument("--database-url", help="benchmark against this database instead of a temporary SQLite file (must be empty unless --reset-database)")
+    parser.add_argument("--reset-database", action="store_true", help="drop and recreate all tables of --database-url before seeding (DESTROYS its data)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    try:
+        current = asyncio.run(run(args.campsites, args.users, args.requests, args.concurrency, args.seed, args.route, args.cold_cache, args.database_url, args.reset_database))
+    except DatabaseNotEmpty as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as fp:
+            baseline = json.load(fp)
+        if baseline.get("config") != current["config"]:
+            print("warning: baseline was recorded with a different config", file=sys.stderr)
+    print(format_report(current, baseline))
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fp:
+            json.dump(current, fp, ensure_ascii=False, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if baseline:
+        regressions = compare(current, baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# 一覧レスポンスのシリアライズ速度の比較
+#   cd app && python -m benchmarks.serialization
+import json
+import time
+from collections import namedtuple
+from schemas.campsite import CampsitePage, campsite_dict, campsite_from_row
+from core.serialization import dumps
+
+Row = namedtuple("Row", "id name description location prefecture price_min price_max pet_friendly latitude longitude")
+
+def make_rows(n: int):
+    return [
+        Row(i, f"キャンプ場{i}", "富士山が見える絶景のキャンプ場です。" * 3, "山梨県富士吉田市", "山梨", 3000, 7000, i % 2 == 0, 35.4 + i * 1e-5, 138.7)
+        for i in range(1, n + 1)
+    ]
+
+def via_models(rows, tags):
+    # 変更前: 行ごとに Campsite を作り、FastAPI が response_model で
+    # dict 化 → 再検証 → JSON 用に dump → json.dumps する流れ
+    page = CampsitePage(items=[campsite_from_row(c, tags) for c in rows], next_cursor=None)
+    validated = CampsitePage.model_validate(page.model_dump())
+    return json.dumps(validated.model_dump(mode="json"), ensure_ascii=False).encode()
+
+def fast_path(rows, tags):
+    return dumps({"items": [campsite_dict(c, tags) for c in rows], "next_cursor": None})
+
+def best_of(func, *args, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    tags = ["富士山", "絶景", "ペット可"]
+    print(f"{'rows':>6} {'models (ms)':>12} {'fast (ms)':>10} {'speedup':>8}")
+    for n in (1000, 10000):
+        rows = make_rows(n)
+        assert json.loads(via_models(rows, tags)) == json.loads(fast_path(rows, tags))
+        slow = best_of(via_models, rows, tags)
+        fast = best_of(fast_path, rows, tags)
+        print(f"{n:>6} {slow * 1000:>12.1f} {fast * 1000:>10.1f} {slow / fast:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
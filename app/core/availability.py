@@ -0,0 +1,179 @@
+import calendar
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import bindparam, delete, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.availability import DBCampsiteAvailability
+from models.campsite import DBCampsite
+from core.config import AVAILABILITY_MAX_NIGHTS, AVAILABILITY_MAX_YEARS_AHEAD
+from core.upsert import insert_ignore
+
+# 空き状況: キャンプ場 × 年ごとに「1日1バイトの空き枠数」と「空きありの日のビットマップ」を持つ
+# 日付範囲の検索は、範囲のマスクとビットマップの AND がマスクと一致するかで判定する（日ごとの行を JOIN しない）
+
+MAX_CAPACITY = 255
+
+def days_in_year(year: int) -> int:
+    return 366 if calendar.isleap(year) else 365
+
+def day_index(d: date) -> int:
+    return d.timetuple().tm_yday - 1
+
+def pack_bitmap(capacity: bytes, min_capacity: int = 1) -> int:
+    bits = 0
+    for i, n in enumerate(capacity):
+        if n >= min_capacity:
+            bits |= 1 << i
+    return bits
+
+def bitmap_bytes(bits: int, year: int) -> bytes:
+    return bits.to_bytes((days_in_year(year) + 7) // 8, "little")
+
+def range_masks(start: date, end: date) -> Dict[int, int]:
+    # [start, end) の日を年ごとのビットマスクにする
+    masks: Dict[int, int] = {}
+    d = start
+    while d < end:
+        year_end = min(end, date(d.year + 1, 1, 1))
+        lo, hi = day_index(d), day_index(year_end - timedelta(days=1))
+        masks[d.year] = ((1 << (hi - lo + 1)) - 1) << lo
+        d = year_end
+    return masks
+
+def availability_window() -> Tuple[date, date]:
+    # 扱う期間は前年の元日から AVAILABILITY_MAX_YEARS_AHEAD 年後の大晦日まで（日付の計算より先に確認し、範囲外の年の行も作らない）
+    today = date.today()
+    return date(today.year - 1, 1, 1), date(today.year + AVAILABILITY_MAX_YEARS_AHEAD, 12, 31)
+
+def check_window(*days: date) -> None:
+    first, last = availability_window()
+    for d in days:
+        if not first <= d <= last:
+            raise HTTPException(status_code=400, detail=f"Dates must be between {first} and {last}")
+
+def check_stay(check_in: date, check_out: date) -> None:
+    check_window(check_in)
+    nights = (check_out - check_in).days
+    if nights < 1:
+        raise HTTPException(status_code=400, detail="check_out must be after check_in")
+    if nights > AVAILABILITY_MAX_NIGHTS:
+        raise HTTPException(status_code=400, detail=f"Stay is too long (max {AVAILABILITY_MAX_NIGHTS} nights)")
+    # check_out の日は泊まらないので、最終泊が期間内なら check_out は翌年の元日でもよい
+    check_window(check_out - timedelta(days=1))
+
+def check_period(start: date, end: date) -> None:
+    check_window(start, end)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+
+async def set_availability(db: AsyncSession, items: Iterable[Tuple[int, date, date, int]]) -> Tuple[int, List[int]]:
+    # items: (campsite_id, start, end（含む）, 空き枠数)。対象の年の行をまとめて読み、書き換えて executemany で保存する
+    items = list(items)
+    campsite_ids = {i[0] for i in items}
+    result = await db.execute(select(DBCampsite.id).where(DBCampsite.id.in_(campsite_ids)))
+    known = set(result.scalars().all())
+    unknown = sorted(campsite_ids - known)
+    items = [i for i in items if i[0] in known]
+    if not items:
+        return 0, unknown
+    keys = sorted({(i[0], y) for i in items for y in range(i[1].year, i[2].year + 1)})
+    table = DBCampsiteAvailability.__table__
+
+    # 年の行は1年分をまとめて読み書きするので、同時に書き込むと片方の更新が消える
+    # 先にない行を作ってから（同時に作っても衝突しない）、行をロックして読み直す
+    # （SQLite は最初の INSERT で書き込みロックを取るので、後から来た書き込みはコミットまで待つ）
+    await insert_ignore(db, table, ["campsite_id", "year"], [
+        {"campsite_id": campsite_id, "year": year, "capacity": bytes(days_in_year(year)), "available": bitmap_bytes(0, year)}
+        for campsite_id, year in keys
+    ])
+    result = await db.execute(
+        select(table.c.campsite_id, table.c.year, table.c.capacity)
+        .where(tuple_(table.c.campsite_id, table.c.year).in_(keys))
+        .with_for_update()
+    )
+    calendars = {(row.campsite_id, row.year): bytearray(row.capacity) for row in result}
+    for campsite_id, start, end, capacity in items:
+        value = max(0, min(MAX_CAPACITY, capacity))
+        d = start
+        while d <= end:
+            year_end = min(end, date(d.year, 12, 31))
+            lo, hi = day_index(d), day_index(year_end)
+            calendars[(campsite_id, d.year)][lo:hi + 1] = bytes([value]) * (hi - lo + 1)
+            d = year_end + timedelta(days=1)
+
+    await db.execute(
+        update(table)
+        .where(table.c.campsite_id == bindparam("b_campsite_id"), table.c.year == bindparam("b_year"))
+        .values(capacity=bindparam("capacity"), available=bindparam("available")),
+        [
+            {"b_campsite_id": campsite_id, "b_year": year, "capacity": bytes(cal), "available": bitmap_bytes(pack_bitmap(cal), year)}
+            for (campsite_id, year), cal in calendars.items()
+        ],
+    )
+    return len(calendars), unknown
+
+async def get_calendar(db: AsyncSession, campsite_id: int, start: date, end: date) -> List[dict]:
+    # [start, end] の日ごとの空き枠数（行がない年は 0）
+    result = await db.execute(
+        select(DBCampsiteAvailability.year, DBCampsiteAvailability.capacity)
+        .where(DBCampsiteAvailability.campsite_id == campsite_id, DBCampsiteAvailability.year.between(start.year, end.year))
+    )
+    capacity = {row.year: row.capacity for row in result}
+    days = []
+    d = start
+    while d <= end:
+        cal = capacity.get(d.year)
+        days.append({"date": d.isoformat(), "capacity": cal[day_index(d)] if cal else 0})
+        d += timedelta(days=1)
+    return days
+
+def stay_matches(rows: Dict[int, Tuple[bytes, bytes]], masks: Dict[int, int], min_capacity: int) -> bool:
+    # rows: year -> (available, capacity)。すべての年でマスクの日が空いていれば一致
+    for year, mask in masks.items():
+        row = rows.get(year)
+        if row is None:
+            return False
+        available, capacity = row
+        bits = int.from_bytes(available, "little") if min_capacity <= 1 else pack_bitmap(capacity, min_capacity)
+        if bits & mask != mask:
+            return False
+    return True
+
+def available_query(campsite_ids, masks: Dict[int, int], after_id: Optional[int], min_capacity: int):
+    # 絞り込み済みのキャンプ場 id（サブクエリ）について、対象年のビットマップを id 順に読む
+    columns = [DBCampsiteAvailability.campsite_id, DBCampsiteAvailability.year, DBCampsiteAvailability.available]
+    if min_capacity > 1:
+        columns.append(DBCampsiteAvailability.capacity)
+    query = (
+        select(*columns)
+        .where(DBCampsiteAvailability.campsite_id.in_(campsite_ids), DBCampsiteAvailability.year.in_(list(masks)))
+        .order_by(DBCampsiteAvailability.campsite_id, DBCampsiteAvailability.year)
+    )
+    if after_id is not None:
+        query = query.where(DBCampsiteAvailability.campsite_id > after_id)
+    return query
+
+async def find_available(db: AsyncSession, campsite_ids, check_in: date, check_out: date, limit: int, after_id: Optional[int] = None, min_capacity: int = 1) -> List[int]:
+    # 条件に合う id を id 順に最大 limit 件。ストリームで読み、必要な件数が揃ったら打ち切る
+    masks = range_masks(check_in, check_out)
+    found: List[int] = []
+    current, rows = None, {}
+    result = await db.stream(available_query(campsite_ids, masks, after_id, min_capacity))
+    try:
+        async for row in result:
+            if row.campsite_id != current:
+                if current is not None and stay_matches(rows, masks, min_capacity):
+                    found.append(current)
+                    if len(found) >= limit:
+                        return found
+                current, rows = row.campsite_id, {}
+            rows[row.year] = (row.available, getattr(row, "capacity", None))
+        if current is not None and stay_matches(rows, masks, min_capacity):
+            found.append(current)
+        return found
+    finally:
+        await result.close()
+
+async def delete_availability(db: AsyncSession, campsite_ids: List[int]) -> None:
+    await db.execute(delete(DBCampsiteAvailability).where(DBCampsiteAvailability.campsite_id.in_(campsite_ids)))
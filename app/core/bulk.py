@@ -0,0 +1,155 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator, List, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.campsite import DBCampsite
+from schemas.campsite import CampsiteCreate
+from core.cache import invalidate_campsites
+from core.changes import change_notifier, record_changes
+from core.etag import bump_catalog_version
+from core.facets import apply_facet_delta, facet_delta
+from core.geo import geohash_for
+from core.search import index_new_campsites
+from core.tags import add_tags_bulk, normalize_tags
+
+# 一括インポート: ストリームで受け取った NDJSON / CSV を1行ずつ検証し、バッチ単位で INSERT する
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buf = ""
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield buf.rstrip("\r")
+
+async def iter_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, e
+
+async def iter_csv(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    # クォート内の改行に対応するため、" の数が偶数になるまで行をつなげてから解析する
+    header = None
+    record, start, line_no = [], 0, 0
+    async for line in lines:
+        line_no += 1
+        if not record:
+            start = line_no
+        record.append(line)
+        text = "\n".join(record)
+        if text.count('"') % 2:
+            continue
+        record = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = values
+            continue
+        row = {k: (v if v != "" else None) for k, v in zip(header, values)}
+        row["tags"] = row["tags"].split(",") if row.get("tags") else []
+        yield start, row
+
+def _values(c: CampsiteCreate, catalog_version: int) -> dict:
+    values = c.dict(exclude={"tags"})
+    values["geohash"] = geohash_for(c.latitude, c.longitude)
+    values["created_version"] = catalog_version
+    return values
+
+async def _insert_campsites(db: AsyncSession, campsites: List[CampsiteCreate], catalog_version: int) -> List[int]:
+    rows = [_values(c, catalog_version) for c in campsites]
+    if db.bind.dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = await db.execute(insert(DBCampsite.__table__).returning(DBCampsite.id, sort_by_parameter_order=True), rows)
+        return [r.id for r in result]
+    if db.bind.dialect.name == "mysql":
+        # 複数行 VALUES の INSERT は「simple insert」なので InnoDB は auto_increment_increment 刻みで続けて割り当てる
+        # （lastrowid は先頭行の id）。刻みはセッションごとに変えられるので毎回読む
+        step = (await db.execute(text("SELECT @@auto_increment_increment"))).scalar()
+        result = await db.execute(insert(DBCampsite.__table__).values(rows))
+        return list(range(result.lastrowid, result.lastrowid + len(rows) * step, step))
+    ids = []
+    for row in rows:
+        result = await db.execute(insert(DBCampsite.__table__).values(**row))
+        ids.append(result.inserted_primary_key[0])
+    return ids
+
+async def insert_batch(db: AsyncSession, campsites: List[CampsiteCreate]) -> List[int]:
+    # キャンプ場本体・タグ・検索索引を1トランザクションで登録する
+    # 新しい行には作成時のカタログのバージョンを入れる（ETag 用）ので、先にバージョンを進める
+    version = await bump_catalog_version(db)
+    ids = await _insert_campsites(db, campsites, version)
+    await add_tags_bulk(db, {i: c.tags for i, c in zip(ids, campsites)})
+    await index_new_campsites(db, [(i, c.name, c.description, c.location) for i, c in zip(ids, campsites)])
+    await apply_facet_delta(db, facet_delta(added=[dict(c.dict(), tags=normalize_tags(c.tags)) for c in campsites]))
+    await record_changes(db, ids)
+    await db.commit()
+    await invalidate_campsites(ids, [dict(c.dict(), id=i) for i, c in zip(ids, campsites)], version)
+    change_notifier.notify()
+    return ids
+
+class ImportReport:
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line_no: int, detail) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line_no, "error": detail})
+
+    def dict(self) -> dict:
+        return {"inserted": self.inserted, "failed": self.failed, "errors": self.errors}
+
+async def _flush(db: AsyncSession, batch: List[Tuple[int, CampsiteCreate]], report: ImportReport) -> None:
+    try:
+        await insert_batch(db, [c for _, c in batch])
+        report.inserted += len(batch)
+        return
+    except SQLAlchemyError:
+        await db.rollback()
+    # バッチが DB エラーで失敗したら1行ずつ入れ直し、失敗した行だけをエラーにする
+    for line_no, c in batch:
+        try:
+            await insert_batch(db, [c])
+            report.inserted += 1
+        except SQLAlchemyError as e:
+            await db.rollback()
+            report.error(line_no, str(e.orig if getattr(e, "orig", None) else e))
+
+async def import_campsites(db: AsyncSession, records: AsyncIterator[Tuple[int, object]], batch_size: int, max_errors: int) -> dict:
+    report = ImportReport(max_errors)
+    batch = []
+    async for line_no, record in records:
+        if isinstance(record, Exception):
+            report.error(line_no, str(record))
+            continue
+        try:
+            batch.append((line_no, CampsiteCreate(**record)))
+        except (ValidationError, TypeError) as e:
+            if isinstance(e, ValidationError):
+                report.error(line_no, [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()])
+            else:
+                report.error(line_no, str(e))
+            continue
+        if len(batch) >= batch_size:
+            await _flush(db, batch, report)
+            batch = []
+    if batch:
+        await _flush(db, batch, report)
+    return report.dict()
@@ -0,0 +1,170 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, List, Optional
+from core.config import CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS
+from core.filters import filter_key
+from core.tags import normalize_tags
+from schemas.campsite import CampsiteFilter
+
+# キャッシュのバックエンド。Redis 等を使う場合はこのインターフェースを実装する（未実装のメソッドがあると生成時に TypeError）
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: Hashable) -> Optional[Any]: ...
+
+    @abstractmethod
+    async def set(self, key: Hashable, value: Any) -> None: ...
+
+    @abstractmethod
+    async def delete(self, key: Hashable) -> None: ...
+
+    @abstractmethod
+    async def keys(self) -> Iterable[Hashable]: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> dict: ...
+
+# プロセス内の LRU + TTL キャッシュ（件数上限つき）
+class LRUCache(CacheBackend):
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    async def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def keys(self):
+        return list(self._data.keys())
+
+    async def clear(self):
+        self._data.clear()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self):
+        return {
+            "backend": "lru",
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+campsite_cache: CacheBackend = LRUCache()
+
+# 書き込み（コミット済み）で進んだカタログのバージョン。これより古いスナップショットから読んだ結果はキャッシュに載せない
+# （遅れているレプリカや書き込み前に始まった読み取りが、無効化した直後のキーへ古い本文を入れ直して TTL の間残るのを防ぐ）
+# あわせてバケット（詳細は id、一覧はフィルタの次元と値）ごとに最後に書き込んだバージョンを世代として持ち、キーに含める
+# 書き込みは行が属するバケットの世代を進めるだけで、古いキーは参照されなくなり LRU / TTL で消える（キーを走査しない）
+class CatalogWatermark:
+    def __init__(self, max_generations: int = CACHE_MAX_ENTRIES):
+        self.version = 0
+        self.max_generations = max_generations
+        self._generations: "OrderedDict[Hashable, int]" = OrderedDict()
+        # 追い出したバケットの世代の最大値。記録のないバケットはこの世代とみなす（追い出すと古いキーが外れるだけで安全側）
+        self._floor = 0
+
+    def advance(self, version: int, buckets: Iterable[Hashable] = ()) -> None:
+        self.version = max(self.version, version)
+        for bucket in buckets:
+            self._generations[bucket] = max(self.generation(bucket), version)
+            self._generations.move_to_end(bucket)
+        while len(self._generations) > self.max_generations:
+            _, generation = self._generations.popitem(last=False)
+            self._floor = max(self._floor, generation)
+
+    def advance_all(self, version: int) -> None:
+        # すべてのバケットの世代を version にする
+        self.version = max(self.version, version)
+        self._generations.clear()
+        self._floor = max(self._floor, version)
+
+    def generation(self, bucket: Hashable) -> int:
+        return self._generations.get(bucket, self._floor)
+
+    def is_current(self, version: int) -> bool:
+        return version >= self.version
+
+    def reset(self) -> None:
+        # DB を作り直したとき用（バージョンが 0 からやり直しになる）
+        self.version = 0
+        self._generations.clear()
+        self._floor = 0
+
+catalog_watermark = CatalogWatermark()
+
+async def cache_if_current(key: Hashable, value: Any, catalog_version: int) -> None:
+    # catalog_version は値を読んだのと同じ DB（同じ文）から得たバージョン
+    if catalog_watermark.is_current(catalog_version):
+        await campsite_cache.set(key, value)
+
+# 等価条件で絞れる一覧はその次元のバケットに、絞れないもの（キーワード・料金だけ・条件なし）は "*" に属する
+def list_buckets(filters: CampsiteFilter) -> List[tuple]:
+    if filters.prefecture:
+        return [("prefecture", filters.prefecture)]
+    if filters.pet_friendly is not None:
+        return [("pet_friendly", filters.pet_friendly)]
+    tags = normalize_tags(filters.tags or [])
+    if tags:
+        # any でも all でも、一致する行はどれかのタグを持つ
+        return [("tag", t) for t in sorted(tags)]
+    return [("*",)]
+
+def row_buckets(row: dict) -> List[tuple]:
+    # 行が一致しうる一覧のバケット（list_buckets のどれを選んでも、一致するならこの中に入る）
+    return [("prefecture", row.get("prefecture")), ("pet_friendly", row.get("pet_friendly")), ("*",)] + [("tag", t) for t in row.get("tags") or []]
+
+def detail_key(campsite_id: int, fields: Optional[tuple] = None) -> tuple:
+    generation = catalog_watermark.generation(("campsite", campsite_id))
+    return ("campsite", campsite_id, generation) if fields is None else ("campsite", campsite_id, generation, fields)
+
+def list_key(filters: CampsiteFilter, sort: str, cursor: Optional[str], limit: int, fields: Optional[tuple] = None) -> tuple:
+    generations = tuple(catalog_watermark.generation(b) for b in list_buckets(filters))
+    return ("list", filter_key(filters), sort, cursor, limit, fields, generations)
+
+async def invalidate_all(catalog_version: int) -> None:
+    # 対象行が事前に分からない一括更新・削除用（統計カウンタは残す）
+    catalog_watermark.advance_all(catalog_version)
+
+async def invalidate_campsite(campsite_id: int, *rows: dict, catalog_version: int) -> None:
+    await invalidate_campsites([campsite_id], rows, catalog_version)
+
+async def invalidate_campsites(campsite_ids: Iterable[int], rows: Iterable[dict], catalog_version: int) -> None:
+    # 詳細（フィールド指定違いも含む）と、変更前後の行が一致しうる一覧の世代を進める
+    # catalog_version はコミットした書き込みのバージョン
+    buckets = {("campsite", i) for i in campsite_ids}
+    for row in rows:
+        buckets.update(row_buckets(row))
+    catalog_watermark.advance(catalog_version, buckets)
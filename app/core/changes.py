@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.campsite import DBCampsite
+from models.change import DBCampsiteChange
+from schemas.campsite import campsite_dict
+from core.config import CHANGES_PAGE_SIZE, CHANGES_POLL_SECONDS, CHANGES_RETENTION_DAYS, CHANGES_STREAM_MAX_SECONDS
+from core.pagination import decode_cursor, encode_cursor
+from core.serialization import dumps
+from core.tags import load_tags
+
+# 差分同期: 管理APIの書き込みごとに変更履歴へ (seq, campsite_id) を追記し、
+# クライアントは前回のトークン（seq）より後に変わった行と削除された id だけを受け取る
+
+async def record_changes(db: AsyncSession, campsite_ids: List[int], deleted: bool = False) -> None:
+    # bump_catalog_version の後に呼ぶ（カタログの行ロックを持ったまま採番するので seq の順がコミット順と一致する）
+    if campsite_ids:
+        await db.execute(insert(DBCampsiteChange), [{"campsite_id": i, "deleted": deleted} for i in campsite_ids])
+
+def change_token(seq: int) -> str:
+    return encode_cursor({"seq": seq})
+
+def parse_change_token(token: str) -> int:
+    seq = decode_cursor(token).get("seq")
+    if not isinstance(seq, int):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return seq
+
+async def latest_seq(db: AsyncSession) -> int:
+    result = await db.execute(select(func.max(DBCampsiteChange.seq)))
+    return result.scalar() or 0
+
+async def check_token_age(db: AsyncSession, since: int) -> None:
+    # since の直後の履歴が削除済み（prune_changes）なら差分を作れないので 410。クライアントは一覧 API から取り直す
+    result = await db.execute(select(func.min(DBCampsiteChange.seq)))
+    oldest = result.scalar()
+    if oldest is not None and since < oldest - 1:
+        raise HTTPException(status_code=410, detail="Sync token is too old, resync from the campsite list")
+
+async def prune_changes(db: AsyncSession) -> int:
+    # 保持期間より古い履歴を seq の先頭から削除する（最新の1件は残し、トークンの古さを判定できるようにする）
+    cutoff = datetime.utcnow() - timedelta(days=CHANGES_RETENTION_DAYS)
+    result = await db.execute(select(func.max(DBCampsiteChange.seq)).where(DBCampsiteChange.changed_at < cutoff))
+    through = result.scalar()
+    if through is None:
+        return 0
+    result = await db.execute(delete(DBCampsiteChange).where(DBCampsiteChange.seq <= through, DBCampsiteChange.seq < await latest_seq(db)))
+    return result.rowcount
+
+async def change_page(db: AsyncSession, since: Optional[int], limit: int = CHANGES_PAGE_SIZE) -> dict:
+    # since がなければ現在のトークンだけを返す（全件は一覧 API で取得してから、このトークンで差分を追う）
+    if since is None:
+        return {"updated": [], "deleted": [], "next": change_token(await latest_seq(db)), "has_more": False}
+    await check_token_age(db, since)
+    # 同じキャンプ場の複数回の変更は最後の1件にまとめ、その seq の順に返す
+    last_seq = func.max(DBCampsiteChange.seq)
+    result = await db.execute(
+        select(DBCampsiteChange.campsite_id, last_seq.label("seq"))
+        .where(DBCampsiteChange.seq > since)
+        .group_by(DBCampsiteChange.campsite_id)
+        .order_by(last_seq)
+        .limit(limit + 1)
+    )
+    changes = result.fetchall()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if not changes:
+        return {"updated": [], "deleted": [], "next": change_token(since), "has_more": False}
+    ids = [c.campsite_id for c in changes]
+    result = await db.execute(DBCampsite.__table__.select().where(DBCampsite.id.in_(ids)))
+    rows = {c.id: c for c in result}
+    tags = await load_tags(db, list(rows))
+    # 今の行があれば更新、なければ削除（墓標）として返す
+    return {
+        "updated": [campsite_dict(rows[i], tags[i]) for i in ids if i in rows],
+        "deleted": [i for i in ids if i not in rows],
+        "next": change_token(changes[-1].seq),
+        "has_more": has_more,
+    }
+
+class ChangeNotifier:
+    # 同じプロセス内の書き込みを待機中の SSE 接続へすぐ知らせる（他プロセスの書き込みは定期的な問い合わせで拾う）
+    # 通知ごとに seq を進める。待つ側は DB を読む前の seq を覚えておき、読んでいる間の通知も取りこぼさない
+    def __init__(self):
+        self.seq = 0
+        self._event = asyncio.Event()
+
+    def notify(self) -> None:
+        self.seq += 1
+        self._event.set()
+        self._event = asyncio.Event()
+
+    async def wait(self, seen: int, timeout: float) -> bool:
+        # seen より後の通知があれば True（すでにあればすぐ返る）
+        if self.seq != seen:
+            return True
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+change_notifier = ChangeNotifier()
+
+async def change_events(db: AsyncSession, since: int):
+    # Server-Sent Events: 変更があるたびに change_page と同じ JSON を送る（id はトークンなので Last-Event-ID で再開できる）
+    # 接続は CHANGES_STREAM_MAX_SECONDS で閉じ、クライアントの再接続に任せる
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CHANGES_STREAM_MAX_SECONDS
+    while True:
+        seen = change_notifier.seq
+        page = await change_page(db, since)
+        # 待機中に DB 接続を持ち続けない
+        await db.rollback()
+        if page["updated"] or page["deleted"]:
+            since = parse_change_token(page["next"])
+            yield b"id: " + page["next"].encode() + b"\nevent: changes\ndata: " + dumps(page) + b"\n\n"
+            if page["has_more"]:
+                continue
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        if not await change_notifier.wait(seen, min(CHANGES_POLL_SECONDS, remaining)):
+            yield b": keep-alive\n\n"
@@ -0,0 +1,60 @@
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.campsite import DBCampsite
+from models.catalog import DBCatalogVersion
+from core.config import HTTP_CACHE_MAX_AGE
+from core.serialization import JSONBytesResponse
+from core.upsert import upsert_increment
+
+CACHE_CONTROL = f"public, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+
+async def bump_catalog_version(db: AsyncSession) -> int:
+    # 書き込みと同じトランザクションで呼ぶ。新しいバージョンを返す（コミット後にキャッシュの透かしを進めるのに使う）
+    await upsert_increment(db, DBCatalogVersion.__table__, ["id"], "version", [{"id": 1, "version": 1}])
+    return await catalog_version(db)
+
+async def catalog_version(db: AsyncSession) -> int:
+    result = await db.execute(select(DBCatalogVersion.version).where(DBCatalogVersion.id == 1))
+    return result.scalar() or 0
+
+def catalog_version_column():
+    # 行と同じ文で読むカタログのバージョン（行と同じスナップショットの値になる）
+    return func.coalesce(select(DBCatalogVersion.version).where(DBCatalogVersion.id == 1).scalar_subquery(), 0).label("catalog_version")
+
+ETAG_COLUMNS = (DBCampsite.id, DBCampsite.version, DBCampsite.created_version)
+
+async def campsite_revision(db: AsyncSession, campsite_id: int):
+    # ETag の計算に要る列だけを主キーで引く（行がなければ None）
+    result = await db.execute(select(*ETAG_COLUMNS).where(DBCampsite.id == campsite_id))
+    return result.first()
+
+def campsite_etag(c, fields: Optional[tuple] = None) -> str:
+    # c は ETAG_COLUMNS を含む行。version は作り直すと 1 に戻るので、作成時のカタログのバージョンも含める
+    tag = f"c{c.id}-v{c.version}-g{c.created_version}"
+    if fields is None:
+        return f'"{tag}"'
+    # フィールド指定が違えば表現も違うので ETag も分ける
+    digest = hashlib.sha1(",".join(fields).encode()).hexdigest()[:8]
+    return f'"{tag}-f{digest}"'
+
+def list_etag(version: int, key: tuple) -> str:
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f'"l{version}-{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [t.strip() for t in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def json_with_etag(body: bytes, etag: str) -> Response:
+    return JSONBytesResponse(body, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
@@ -0,0 +1,94 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.campsite import DBCampsite
+from models.facet import DBCampsiteFacet
+from models.tag import DBTag, DBCampsiteTag
+from schemas.campsite import CampsiteFilter
+from core.filters import apply_campsite_filter, filter_key
+from core.upsert import upsert_increment
+
+# ファセット件数: 絞り込みなしはサマリテーブルから1クエリで返し、絞り込みありは DB 側で GROUP BY する
+
+FACETS = ("prefecture", "pet_friendly", "tag")
+
+def _bool_value(value: bool) -> str:
+    return "true" if value else "false"
+
+def facet_pairs(row: dict) -> List[Tuple[str, str]]:
+    # 1行が寄与する (facet, value) の一覧
+    pairs = [("total", "")]
+    if row.get("prefecture"):
+        pairs.append(("prefecture", row["prefecture"]))
+    if row.get("pet_friendly") is not None:
+        pairs.append(("pet_friendly", _bool_value(row["pet_friendly"])))
+    pairs.extend(("tag", name) for name in row.get("tags") or [])
+    return pairs
+
+def facet_delta(removed: Iterable[dict] = (), added: Iterable[dict] = ()) -> Counter:
+    delta = Counter()
+    for row in removed:
+        delta.subtract(facet_pairs(row))
+    for row in added:
+        delta.update(facet_pairs(row))
+    return delta
+
+async def apply_facet_delta(db: AsyncSession, delta: Counter) -> None:
+    # 書き込みと同じトランザクションで呼ぶ。差分はまとめて1文で加算し、件数が 0 になった値は消す
+    rows = [{"facet": facet, "value": value, "count": n} for (facet, value), n in delta.items() if n != 0]
+    await upsert_increment(db, DBCampsiteFacet.__table__, ["facet", "value"], "count", rows)
+    if any(row["count"] < 0 for row in rows):
+        await db.execute(delete(DBCampsiteFacet).where(DBCampsiteFacet.count <= 0, DBCampsiteFacet.facet != "total"))
+
+async def _grouped_counts(db: AsyncSession, ids) -> Counter:
+    # ids は campsite.id の select（サブクエリ）。本体とタグの2クエリで数える
+    counts = Counter()
+    result = await db.execute(
+        select(DBCampsite.prefecture, DBCampsite.pet_friendly, func.count())
+        .where(DBCampsite.id.in_(ids))
+        .group_by(DBCampsite.prefecture, DBCampsite.pet_friendly)
+    )
+    for prefecture, pet_friendly, n in result:
+        counts[("total", "")] += n
+        if prefecture:
+            counts[("prefecture", prefecture)] += n
+        if pet_friendly is not None:
+            counts[("pet_friendly", _bool_value(pet_friendly))] += n
+    result = await db.execute(
+        select(DBTag.name, func.count())
+        .select_from(DBCampsiteTag)
+        .join(DBTag, DBTag.id == DBCampsiteTag.tag_id)
+        .where(DBCampsiteTag.campsite_id.in_(ids))
+        .group_by(DBTag.name)
+    )
+    for name, n in result:
+        counts[("tag", name)] += n
+    return counts
+
+async def counts_for_ids(db: AsyncSession, campsite_ids: List[int]) -> Counter:
+    # 一括更新・削除の前後で対象行の寄与分を数える
+    if not campsite_ids:
+        return Counter()
+    return await _grouped_counts(db, select(DBCampsite.id).where(DBCampsite.id.in_(campsite_ids)))
+
+async def rebuild_facets(db: AsyncSession) -> int:
+    # サマリテーブルを全件から作り直す（初回導入時・不整合時用）
+    counts = await _grouped_counts(db, select(DBCampsite.id))
+    await db.execute(delete(DBCampsiteFacet))
+    await db.execute(insert(DBCampsiteFacet), [{"facet": f, "value": v, "count": n} for (f, v), n in counts.items()] or [{"facet": "total", "value": "", "count": 0}])
+    return counts[("total", "")]
+
+def _facet_dict(counts: Dict[Tuple[str, str], int]) -> dict:
+    facets = {"total": counts.get(("total", ""), 0)}
+    for facet in FACETS:
+        values = {v: n for (f, v), n in counts.items() if f == facet and n > 0}
+        # 件数の多い順（同数は値の順）
+        facets[facet] = dict(sorted(values.items(), key=lambda item: (-item[1], item[0])))
+    return facets
+
+async def facet_counts(db: AsyncSession, f: CampsiteFilter) -> dict:
+    if not filter_key(f):
+        result = await db.execute(select(DBCampsiteFacet.facet, DBCampsiteFacet.value, DBCampsiteFacet.count))
+        return _facet_dict({(row.facet, row.value): row.count for row in result})
+    return _facet_dict(await _grouped_counts(db, apply_campsite_filter(select(DBCampsite.id), f)))
@@ -0,0 +1,34 @@
+from typing import Optional, Tuple
+from fastapi import HTTPException, Query
+from models.campsite import DBCampsite
+from schemas.campsite import Campsite
+
+# 疎なフィールドセット（?fields=id,name,prefecture,price_min）: SELECT する列と応答の項目を絞る
+
+CAMPSITE_FIELDS = list(Campsite.__fields__)
+
+def campsite_fields(fields: Optional[str] = Query(None, description="Comma-separated Campsite fields to return (id is always included)")) -> Optional[Tuple[str, ...]]:
+    if fields is None:
+        return None
+    names = {n.strip() for n in fields.split(",") if n.strip()}
+    unknown = names - set(CAMPSITE_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    names.add("id")
+    # キャッシュキー・ETag が指定順に依存しないよう、スキーマの項目順に並べる
+    return tuple(n for n in CAMPSITE_FIELDS if n in names)
+
+def campsite_columns(fields: Optional[Tuple[str, ...]], *extra) -> list:
+    # fields=None は全列。extra には並び替えキーなど、応答に含めなくても読む必要がある列を渡す
+    table = DBCampsite.__table__
+    columns = list(table.c) if fields is None else [table.c[n] for n in fields if n != "tags"]
+    names = {c.name for c in columns}
+    for column in extra:
+        if column.name not in names:
+            columns.append(column)
+            names.add(column.name)
+    return columns
+
+def wants_tags(fields: Optional[Tuple[str, ...]]) -> bool:
+    # タグは別テーブルなので、要求されたときだけ読む
+    return fields is None or "tags" in fields
@@ -0,0 +1,45 @@
+from typing import List, Literal, Optional
+from fastapi import Query
+from models.campsite import DBCampsite
+from schemas.campsite import CampsiteFilter
+from core.search import keyword_clause
+from core.tags import normalize_tags, tag_clause
+
+# 一覧・エクスポートなどで共通の検索条件（クエリパラメータ）
+
+def campsite_filter(keyword: Optional[str] = None, prefecture: Optional[str] = None, pet_friendly: Optional[bool] = None, tag: Optional[List[str]] = Query(None), tag_mode: Literal["any", "all"] = "any", price_gte: Optional[int] = None, price_lte: Optional[int] = None) -> CampsiteFilter:
+    return CampsiteFilter(keyword=keyword, prefecture=prefecture, pet_friendly=pet_friendly, tags=normalize_tags(tag or []) or None, tag_mode=tag_mode, price_gte=price_gte, price_lte=price_lte)
+
+def filter_conditions(f: CampsiteFilter, keyword_joined: bool = False) -> list:
+    # 実際に WHERE に付く条件だけを返す（空白だけのキーワード・空のタグは条件にならない）
+    conditions = []
+    if f.keyword:
+        clause = keyword_clause(f.keyword, joined=keyword_joined)
+        if clause is not None:
+            conditions.append(clause)
+    if f.prefecture:
+        conditions.append(DBCampsite.prefecture == f.prefecture)
+    if f.pet_friendly is not None:
+        conditions.append(DBCampsite.pet_friendly == f.pet_friendly)
+    tags = normalize_tags(f.tags or [])
+    if tags:
+        conditions.append(tag_clause(tags, f.tag_mode))
+    # 料金は範囲の重なりで判定する（price_min..price_max と price_gte..price_lte）
+    if f.price_lte is not None:
+        conditions.append(DBCampsite.price_min <= f.price_lte)
+    if f.price_gte is not None:
+        conditions.append(DBCampsite.price_max >= f.price_gte)
+    return conditions
+
+def apply_campsite_filter(query, f: CampsiteFilter, keyword_joined: bool = False):
+    conditions = filter_conditions(f, keyword_joined)
+    return query.where(*conditions) if conditions else query
+
+def filter_key(f: CampsiteFilter) -> tuple:
+    # キャッシュキー用に正規化（未指定・空文字は除外し、項目名順に並べる）
+    items = []
+    for k, v in f.dict().items():
+        if v is None or v == "" or (k == "tag_mode" and not f.tags):
+            continue
+        items.append((k, tuple(sorted(v)) if isinstance(v, list) else v))
+    return tuple(sorted(items))
@@ -0,0 +1,71 @@
+import math
+from typing import List, Optional
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+GEOHASH_PRECISION = 9  # 保存時の精度（約 5m 四方）
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, x = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if x >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+def cell_size(precision: int) -> tuple:
+    # (緯度方向, 経度方向) のセルの大きさ（度）
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def cover_cells(lat: float, lon: float, radius_km: float, max_cells: int = 16) -> List[str]:
+    # 半径 radius_km の円の外接矩形を覆う geohash セルのうち、max_cells 個以内で最も細かいものを返す
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = min(180.0, radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)))
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        cell_lat, cell_lon = cell_size(precision)
+        lat_cells = range(int((min_lat + 90) // cell_lat), int(min(max_lat + 90, 180 - 1e-9) // cell_lat) + 1)
+        lon_cells = range(int((lon - dlon + 180) // cell_lon), int((lon + dlon + 180) // cell_lon) + 1)
+        if len(lat_cells) * len(lon_cells) > max_cells:
+            break
+        best = (precision, cell_lat, cell_lon, lat_cells, lon_cells)
+    precision, cell_lat, cell_lon, lat_cells, lon_cells = best
+    lon_count = int(round(360.0 / cell_lon))
+    cells = set()
+    for i in lat_cells:
+        for j in lon_cells:
+            # 日付変更線をまたぐ場合は経度方向のインデックスを折り返す
+            j %= lon_count
+            cells.add(geohash_encode(-90 + (i + 0.5) * cell_lat, -180 + (j + 0.5) * cell_lon, precision))
+    return sorted(cells)
+
+def geohash_for(lat: Optional[float], lon: Optional[float]) -> Optional[str]:
+    if lat is None or lon is None:
+        return None
+    return geohash_encode(lat, lon)
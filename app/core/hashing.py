@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from fastapi import HTTPException
+from core.config import PASSWORD_BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE, PASSWORD_HASH_QUEUE_TIMEOUT
+
+# パスワードのハッシュ化・検証はイベントループの外（スレッドプール）で行う
+# bcrypt は計算中に GIL を解放するので、プロセスプールでなくても並列に動く
+
+def _secret(password: str) -> bytes:
+    # bcrypt は先頭 72 バイトしか使わない
+    return password.encode()[:72]
+
+def _is_legacy(hashed: str) -> bool:
+    # 旧実装の sha256 hex ダイジェスト
+    return len(hashed) == 64 and all(c in "0123456789abcdef" for c in hashed)
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE, queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT, rounds: int = PASSWORD_BCRYPT_ROUNDS):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._semaphore = None
+        self._loop = None
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # セマフォはイベントループごとに作る
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._semaphore
+
+    async def _run(self, func, *args):
+        semaphore = self._get_semaphore()
+        # 同時実行数を超えた分は待たせ、待ちが多すぎる・長すぎる場合は 503 を返す
+        if self.active + self.waiting >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many authentication requests", headers={"Retry-After": "1"})
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many authentication requests", headers={"Retry-After": "1"})
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.active -= 1
+            semaphore.release()
+
+    def hash_sync(self, password: str) -> str:
+        return bcrypt.hashpw(_secret(password), bcrypt.gensalt(self.rounds)).decode()
+
+    def verify_sync(self, password: str, hashed: str) -> bool:
+        if _is_legacy(hashed):
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), hashed)
+        try:
+            return bcrypt.checkpw(_secret(password), hashed.encode())
+        except ValueError:
+            return False
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.hash_sync, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self.verify_sync, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return _is_legacy(hashed)
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "active": self.active, "waiting": self.waiting, "rejected": self.rejected}
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.campsite import DBCampsite
+from schemas.campsite import campsite_dict
+from database.session import get_read_db
+from core.cache import cache_if_current, campsite_cache, detail_key
+from core.etag import campsite_etag, catalog_version_column
+from core.serialization import dumps
+from core.tags import load_tags
+
+# 詳細の (ETag, JSON) を id ごとに返す。キャッシュにない id は IN 1回でまとめて読み、キャッシュに載せる
+
+async def fetch_campsites(db: AsyncSession, campsite_ids: List[int]) -> Dict[int, Tuple[str, bytes]]:
+    found = {}
+    misses = []
+    for campsite_id in campsite_ids:
+        cached = await campsite_cache.get(detail_key(campsite_id))
+        if cached is not None:
+            found[campsite_id] = cached
+        else:
+            misses.append(campsite_id)
+    if not misses:
+        return found
+    result = await db.execute(select(DBCampsite.__table__, catalog_version_column()).where(DBCampsite.id.in_(misses)))
+    rows = result.fetchall()
+    tags = await load_tags(db, [c.id for c in rows])
+    for c in rows:
+        entry = (campsite_etag(c), dumps(campsite_dict(c, tags[c.id])))
+        await cache_if_current(detail_key(c.id), entry, c.catalog_version)
+        found[c.id] = entry
+    return found
+
+class CampsiteLoader:
+    # DataLoader 方式: 同じイベントループの周回で要求された id をまとめて1回で読み、
+    # 同じ id の要求は1つの Future を共有する（リクエスト単位で使う）
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._pending: List[int] = []
+        # セッションは同時に1つのクエリしか実行できないので、バッチの実行は直列にする
+        self._lock = asyncio.Lock()
+        self.batches = 0
+
+    def load(self, campsite_id: int) -> "asyncio.Future[Optional[Tuple[str, bytes]]]":
+        future = self._futures.get(campsite_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[campsite_id] = loop.create_future()
+            if not self._pending:
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+            self._pending.append(campsite_id)
+        return future
+
+    async def load_many(self, campsite_ids: Iterable[int]) -> List[Optional[Tuple[str, bytes]]]:
+        return await asyncio.gather(*(self.load(i) for i in campsite_ids))
+
+    async def _dispatch(self) -> None:
+        ids, self._pending = self._pending, []
+        async with self._lock:
+            self.batches += 1
+            try:
+                found = await fetch_campsites(self.db, ids)
+            except Exception as e:
+                for campsite_id in ids:
+                    self._futures[campsite_id].set_exception(e)
+                return
+        for campsite_id in ids:
+            self._futures[campsite_id].set_result(found.get(campsite_id))
+
+def get_campsite_loader(db: AsyncSession = Depends(get_read_db)) -> CampsiteLoader:
+    # FastAPI は1リクエスト内で同じ依存関係を1回だけ解決するので、ローダーはリクエスト単位になる
+    return CampsiteLoader(db)
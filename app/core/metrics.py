@@ -0,0 +1,139 @@
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from core.config import METRICS_LATENCY_BUCKETS
+
+# ルートごとのリクエスト数・レイテンシ・SQL 実行数/時間を集計し、Prometheus のテキスト形式で出力する
+# 常時有効にする前提なので、ASGI ミドルウェアと engine イベントだけで数え、ロックや外部ライブラリは使わない
+
+# 実行中のリクエストの SQL 集計先（リクエスト外で実行された SQL は数えない）
+_request_stats: ContextVar[Optional[list]] = ContextVar("request_db_stats", default=None)
+
+class RouteStats:
+    def __init__(self, buckets):
+        self.buckets = [0] * (len(buckets) + 1)  # 最後は +Inf
+        self.count = 0
+        self.seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+class MetricsRegistry:
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.bucket_bounds = sorted(buckets)
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self.in_flight = 0
+
+    def observe(self, method: str, route: str, status: int, seconds: float, db_queries: int, db_seconds: float) -> None:
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[(method, route)] = RouteStats(self.bucket_bounds)
+        stats.buckets[bisect.bisect_left(self.bucket_bounds, seconds)] += 1
+        stats.count += 1
+        stats.seconds += seconds
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.db_queries += db_queries
+        stats.db_seconds += db_seconds
+
+    def clear(self) -> None:
+        self.routes.clear()
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being processed.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_requests_total Requests by route and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        routes = sorted(self.routes.items())
+        for (method, route), stats in routes:
+            for status, n in sorted(stats.statuses.items()):
+                lines.append(f"http_requests_total{{{_labels(method, route)},status=\"{status}\"}} {n}")
+        lines += [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), stats in routes:
+            labels = _labels(method, route)
+            cumulative = 0
+            for bound, n in zip(self.bucket_bounds + [float("inf")], stats.buckets):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"http_request_duration_seconds_bucket{{{labels},le=\"{le}\"}} {cumulative}")
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.seconds}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+        lines += [
+            "# HELP http_request_db_queries_total SQL statements executed while handling requests.",
+            "# TYPE http_request_db_queries_total counter",
+        ]
+        lines += [f"http_request_db_queries_total{{{_labels(m, r)}}} {s.db_queries}" for (m, r), s in routes]
+        lines += [
+            "# HELP http_request_db_seconds_total Time spent executing SQL while handling requests.",
+            "# TYPE http_request_db_seconds_total counter",
+        ]
+        lines += [f"http_request_db_seconds_total{{{_labels(m, r)}}} {s.db_seconds}" for (m, r), s in routes]
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(method: str, route: str) -> str:
+    return f"method=\"{method}\",route=\"{_escape(route)}\""
+
+metrics = MetricsRegistry()
+
+class MetricsMiddleware:
+    # BaseHTTPMiddleware はストリーミング応答を包み直すので使わず、素の ASGI ミドルウェアにする
+    def __init__(self, app, registry: MetricsRegistry = metrics, exclude=("/metrics",)):
+        self.app = app
+        self.registry = registry
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        # [SQL 実行数, SQL 時間]。リスト自体を書き換えるので、子タスクにコピーされた context からも加算できる
+        db_stats = [0, 0.0]
+        token = _request_stats.set(db_stats)
+        self.registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.registry.in_flight -= 1
+            _request_stats.reset(token)
+            # ラベルはパスのテンプレート（/api/campsites/{campsite_id}）にして系列数を抑える
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.registry.observe(scope["method"], route, status, elapsed, db_stats[0], db_stats[1])
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _request_stats.get() is not None:
+        context._metrics_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db_stats = _request_stats.get()
+    start = getattr(context, "_metrics_start", None)
+    if db_stats is None or start is None:
+        return
+    db_stats[0] += 1
+    db_stats[1] += time.perf_counter() - start
+
+def install_query_tracking() -> None:
+    # Engine クラスに登録するので、プライマリ・レプリカ・テスト用の engine すべてが対象になる
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,42 @@
+import base64
+import json
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# カーソルはクライアントから見て不透明な文字列（中身は base64url の JSON）
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return data
+
+def apply_keyset(query, columns: list, cursor: Optional[str]):
+    # columns: [(カーソル上のキー名, カラム, 降順か)] の辞書順でページングする
+    if cursor:
+        after = decode_cursor(cursor)
+        if any(not isinstance(after.get(name), (int, float, str)) for name, _, _ in columns):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        cond = None
+        for name, column, desc in reversed(columns):
+            value = after[name]
+            step = column < value if desc else column > value
+            cond = step if cond is None else or_(step, and_(column == value, cond))
+        # 先頭の列の範囲条件も付けて、インデックスの範囲走査で続きから読めるようにする（OR だけだと使えない）
+        name, column, desc = columns[0]
+        if len(columns) > 1:
+            cond = and_(column <= after[name] if desc else column >= after[name], cond)
+        query = query.where(cond)
+    return query.order_by(*[column.desc() if desc else column for _, column, desc in columns])
+
+def cursor_for(row, columns: list) -> str:
+    return encode_cursor({name: getattr(row, name) for name, _, _ in columns})
@@ -0,0 +1,114 @@
+from collections import Counter
+from typing import Iterable, Optional
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.campsite import DBCampsite
+from models.ngram import DBCampsiteNgram
+
+# name に一致したものを上位に出すためのフィールド重み
+FIELD_WEIGHTS = {"name": 3, "location": 2, "description": 1}
+
+def terms(text: Optional[str]) -> list:
+    return (text or "").lower().split()
+
+def ngrams(term: str) -> list:
+    # 2文字ずつ切り出し、末尾の1文字も単独で持つ（1文字検索に使う）
+    grams = [term[i:i + 2] for i in range(len(term) - 1)]
+    if term:
+        grams.append(term[-1])
+    return grams
+
+def document_grams(name: Optional[str], description: Optional[str], location: Optional[str]) -> Counter:
+    counts = Counter()
+    for field, text in (("name", name), ("description", description), ("location", location)):
+        for term in terms(text):
+            for gram in ngrams(term):
+                counts[gram] += FIELD_WEIGHTS[field]
+    return counts
+
+async def index_campsite(db: AsyncSession, campsite_id: int, name: Optional[str], description: Optional[str], location: Optional[str]) -> None:
+    await db.execute(delete(DBCampsiteNgram).where(DBCampsiteNgram.campsite_id == campsite_id))
+    counts = document_grams(name, description, location)
+    if counts:
+        await db.execute(insert(DBCampsiteNgram), [
+            {"gram": gram, "campsite_id": campsite_id, "score": score} for gram, score in counts.items()
+        ])
+
+async def index_new_campsites(db: AsyncSession, docs: Iterable[tuple]) -> None:
+    # 新規行 (id, name, description, location) をまとめて索引に追加する（executemany）
+    rows = [
+        {"gram": gram, "campsite_id": campsite_id, "score": score}
+        for campsite_id, name, description, location in docs
+        for gram, score in document_grams(name, description, location).items()
+    ]
+    if rows:
+        await db.execute(insert(DBCampsiteNgram), rows)
+
+async def unindex_campsite(db: AsyncSession, campsite_id: int) -> None:
+    await db.execute(delete(DBCampsiteNgram).where(DBCampsiteNgram.campsite_id == campsite_id))
+
+async def rebuild_index(db: AsyncSession) -> int:
+    await db.execute(delete(DBCampsiteNgram))
+    # 読み出しと書き込みを同じ接続で交互に行うので、ストリームではなく id 順のページで読む
+    count, last_id = 0, 0
+    while True:
+        result = await db.execute(
+            select(DBCampsite.id, DBCampsite.name, DBCampsite.description, DBCampsite.location)
+            .where(DBCampsite.id > last_id).order_by(DBCampsite.id).limit(1000)
+        )
+        docs = result.fetchall()
+        if not docs:
+            return count
+        await index_new_campsites(db, docs)
+        count += len(docs)
+        last_id = docs[-1].id
+
+def _term_postings(term: str):
+    if len(term) == 1:
+        # 1文字の場合はその文字で始まる gram をすべて対象にする（主キーの範囲検索）
+        return (
+            select(DBCampsiteNgram.campsite_id.label("campsite_id"), func.sum(DBCampsiteNgram.score).label("score"))
+            .where(DBCampsiteNgram.gram >= term, DBCampsiteNgram.gram < term + "\uffff")
+            .group_by(DBCampsiteNgram.campsite_id)
+        )
+    grams = {term[i:i + 2] for i in range(len(term) - 1)}
+    return (
+        select(DBCampsiteNgram.campsite_id.label("campsite_id"), func.sum(DBCampsiteNgram.score).label("score"))
+        .where(DBCampsiteNgram.gram.in_(grams))
+        .group_by(DBCampsiteNgram.campsite_id)
+        .having(func.count() == len(grams))
+    )
+
+def keyword_scores(keyword: str):
+    # 語ごとのポスティングリストを積集合にとり、スコアを合計したサブクエリ
+    subqueries = [_term_postings(t).subquery() for t in dict.fromkeys(terms(keyword))]
+    if not subqueries:
+        return None
+    if len(subqueries) == 1:
+        return subqueries[0]
+    first = subqueries[0]
+    query = select(first.c.campsite_id.label("campsite_id"), sum((s.c.score for s in subqueries[1:]), first.c.score).label("score"))
+    for s in subqueries[1:]:
+        query = query.join(s, s.c.campsite_id == first.c.campsite_id)
+    return query.subquery()
+
+def keyword_clause(keyword: str, joined: bool = False):
+    # 候補を転置インデックスで絞り込んだうえで、部分一致で確定させる（gram の偶然一致を除く）
+    # joined=True のときは keyword_scores を呼び出し側で JOIN 済みとみなす
+    conditions = []
+    if not joined:
+        scores = keyword_scores(keyword)
+        if scores is None:
+            return None
+        conditions.append(DBCampsite.id.in_(select(scores.c.campsite_id)))
+    for term in terms(keyword):
+        conditions.append(or_(
+            func.lower(DBCampsite.name).contains(term, autoescape=True),
+            func.lower(DBCampsite.description).contains(term, autoescape=True),
+            func.lower(DBCampsite.location).contains(term, autoescape=True),
+        ))
+    return and_(*conditions)
+
+def keyword_matches(keyword: str, texts: Iterable[Optional[str]]) -> bool:
+    haystack = [(t or "").lower() for t in texts]
+    return all(any(term in h for h in haystack) for term in terms(keyword))
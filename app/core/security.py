@@ -1,39 +1,69 @@
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+import time
+import uuid
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import DBUser
 from database.session import get_db
-from core.config import SECRET_KEY, ALGORITHM
-from passlib.context import CryptContext
+from core.config import SECRET_KEY, ALGORITHM, PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS
+from core.cache import LRUCache
+from core.hashing import password_hasher
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/admin/token")
 
 # /app/core/security.py
 
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    # 同期版（スクリプト用）。リクエスト処理中は password_hasher.hash を await する
+    return password_hasher.hash_sync(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def verify_token(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+# 認証済みユーザーのキャッシュ（(sub, jti) -> user id）。管理APIのたびに users を引かないようにする
+principal_cache = LRUCache(max_entries=PRINCIPAL_CACHE_MAX_ENTRIES, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+# 失効させたトークンの jti -> exp（プロセス内。期限を過ぎたものは順次捨てる）
+revoked_tokens = {}
+
+def revoke_token(jti: str, exp: float) -> None:
+    now = time.time()
+    for key in [k for k, v in revoked_tokens.items() if v < now]:
+        del revoked_tokens[key]
+    revoked_tokens[jti] = exp
+
+def is_revoked(jti) -> bool:
+    return jti is not None and jti in revoked_tokens
+
+async def invalidate_principal(username: str) -> None:
+    # ユーザー削除・パスワード変更時に呼ぶ（そのユーザーのキャッシュをすべて捨てる）
+    for key in await principal_cache.keys():
+        if key[0] == username:
+            await principal_cache.delete(key)
+
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        result = await db.execute(DBUser.__table__.select().where(DBUser.username == username))
-        user = result.fetchone()
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid user")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("sub") is None or is_revoked(payload.get("jti")):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+async def verify_token(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    payload = decode_token(token)
+    username = payload["sub"]
+    key = (username, payload.get("jti"))
+    if await principal_cache.get(key) is not None:
+        return username
+    result = await db.execute(DBUser.__table__.select().where(DBUser.username == username))
+    user = result.fetchone()
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid user")
+    await principal_cache.set(key, user.id)
+    return username
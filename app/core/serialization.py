@@ -0,0 +1,18 @@
+import json
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # orjson が無い環境では標準の json で代用する
+    orjson = None
+
+# 一覧などの大きなレスポンスは Pydantic モデルを経由せず、dict から直接 JSON バイト列にする
+# （response_model は OpenAPI のスキーマ用に残す）
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+class JSONBytesResponse(Response):
+    media_type = "application/json"
@@ -0,0 +1,109 @@
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import String, cast, delete, func, insert, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.campsite import DBCampsite
+from models.tag import DBTag, DBCampsiteTag
+from core.upsert import insert_ignore
+
+def normalize_tags(names: Iterable[str]) -> List[str]:
+    # 前後の空白を除き、空文字と重複を取り除く（順序は保つ）
+    return list(dict.fromkeys(n.strip() for n in names if n and n.strip()))
+
+async def get_tag_ids(db: AsyncSession, names: List[str]) -> Dict[str, int]:
+    # 要求された名前 -> タグ id。同じ新しいタグを同時に作っても衝突しないよう、作成は一意制約に任せる
+    if not names:
+        return {}
+    result = await db.execute(select(DBTag.name, DBTag.id).where(DBTag.name.in_(names)))
+    found = {row.name: row.id for row in result}
+    ids = {n: found[n] for n in names if n in found}
+    missing = [n for n in names if n not in ids]
+    if missing:
+        # 新しいタグの id は RETURNING で受け取る（使えない DB・他の書き込みが先に作った分は下で読み直す）
+        created = await insert_ignore(db, DBTag.__table__, ["name"], [{"name": n} for n in missing], returning=[DBTag.name, DBTag.id])
+        ids.update({row.name: row.id for row in created if row.name in missing})
+        missing = [n for n in names if n not in ids]
+    if missing:
+        # 名前ごとに DB の照合順序で比較する（MySQL の既定の照合順序では "camp" が既存の "Camp" に一致し、返る名前が要求と違う）
+        result = await db.execute(union_all(*(select(literal(n, String).label("requested"), DBTag.id).where(DBTag.name == n) for n in missing)))
+        ids.update({row.requested: row.id for row in result})
+    return ids
+
+def _distinct_tags(names: List[str], ids: Dict[str, int]) -> List[str]:
+    # 照合順序で同じタグになる名前（"Camp" と "camp" など）は最初の1つだけを残す
+    distinct = {}
+    for n in names:
+        distinct.setdefault(ids[n], n)
+    return list(distinct.values())
+
+async def set_campsite_tags(db: AsyncSession, campsite_id: int, names: Iterable[str]) -> List[str]:
+    names = normalize_tags(names)
+    await db.execute(delete(DBCampsiteTag).where(DBCampsiteTag.campsite_id == campsite_id))
+    ids = await get_tag_ids(db, names)
+    names = _distinct_tags(names, ids)
+    if names:
+        await db.execute(insert(DBCampsiteTag), [
+            {"campsite_id": campsite_id, "tag_id": ids[n], "position": i} for i, n in enumerate(names)
+        ])
+    return names
+
+async def add_tags_bulk(db: AsyncSession, tags_by_id: Dict[int, Iterable[str]]) -> None:
+    # 新規行のタグをまとめて登録する（タグ解決1回 + executemany 1回）
+    tags_by_id = {i: normalize_tags(names) for i, names in tags_by_id.items()}
+    ids = await get_tag_ids(db, normalize_tags(n for names in tags_by_id.values() for n in names))
+    rows = [
+        {"campsite_id": campsite_id, "tag_id": ids[n], "position": i}
+        for campsite_id, names in tags_by_id.items()
+        for i, n in enumerate(_distinct_tags(names, ids))
+    ]
+    if rows:
+        await db.execute(insert(DBCampsiteTag), rows)
+
+async def clear_campsite_tags(db: AsyncSession, campsite_id: int) -> None:
+    await db.execute(delete(DBCampsiteTag).where(DBCampsiteTag.campsite_id == campsite_id))
+
+async def load_tags(db: AsyncSession, campsite_ids: Iterable[int]) -> Dict[int, List[str]]:
+    # 1ページ分のタグを1回のクエリでまとめて取得する
+    tags = {i: [] for i in campsite_ids}
+    if not tags:
+        return tags
+    result = await db.execute(
+        select(DBCampsiteTag.campsite_id, DBTag.name)
+        .join(DBTag, DBTag.id == DBCampsiteTag.tag_id)
+        .where(DBCampsiteTag.campsite_id.in_(list(tags)))
+        .order_by(DBCampsiteTag.campsite_id, DBCampsiteTag.position)
+    )
+    for row in result:
+        tags[row.campsite_id].append(row.name)
+    return tags
+
+TAG_SEP = "\x1f"
+POSITION_SEP = "\x1e"
+
+def tags_column():
+    # ストリーミング中は追加のクエリを発行できないので、行ごとのタグを文字列に集約して同時に読む
+    # 集約順は保証されないため「位置 + 区切り + タグ名」で持ち、parse_tags_column で並べ直す
+    return (
+        select(func.aggregate_strings(cast(DBCampsiteTag.position, String) + POSITION_SEP + DBTag.name, TAG_SEP))
+        .select_from(DBCampsiteTag)
+        .join(DBTag, DBTag.id == DBCampsiteTag.tag_id)
+        .where(DBCampsiteTag.campsite_id == DBCampsite.id)
+        .scalar_subquery()
+        .label("tags")
+    )
+
+def parse_tags_column(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    pairs = [item.split(POSITION_SEP, 1) for item in value.split(TAG_SEP)]
+    return [name for _, name in sorted(pairs, key=lambda p: int(p[0]))]
+
+def tag_clause(names: List[str], mode: str = "any"):
+    names = normalize_tags(names)
+    query = (
+        select(DBCampsiteTag.campsite_id)
+        .join(DBTag, DBTag.id == DBCampsiteTag.tag_id)
+        .where(DBTag.name.in_(names))
+    )
+    if mode == "all":
+        query = query.group_by(DBCampsiteTag.campsite_id).having(func.count() == len(names))
+    return DBCampsite.id.in_(query)
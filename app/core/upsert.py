@@ -0,0 +1,61 @@
+from typing import List, Optional, Sequence
+from sqlalchemy import Table, and_, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 「行がなければ作成、あれば加算」を1文で行う（集計テーブル・バージョン番号用）
+
+def _dialect_insert(name: str):
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+async def upsert_increment(db: AsyncSession, table: Table, keys: List[str], column: str, rows: List[dict]) -> None:
+    # rows は {キー列..., column: 加算値}。executemany 1回で送る
+    if not rows:
+        return
+    name = db.bind.dialect.name
+    dialect_insert = _dialect_insert(name)
+    if dialect_insert is None:
+        # ON CONFLICT が使えない DB では UPDATE して、0件なら INSERT する
+        for row in rows:
+            where = and_(*(table.c[k] == row[k] for k in keys))
+            result = await db.execute(update(table).where(where).values({column: table.c[column] + row[column]}))
+            if result.rowcount == 0:
+                await db.execute(insert(table).values(**row))
+        return
+    stmt = dialect_insert(table)
+    if name == "mysql":
+        stmt = stmt.on_duplicate_key_update({column: table.c[column] + stmt.inserted[column]})
+    else:
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_={column: table.c[column] + stmt.excluded[column]})
+    await db.execute(stmt, rows)
+
+async def insert_ignore(db: AsyncSession, table: Table, keys: List[str], rows: List[dict], returning: Optional[Sequence] = None) -> list:
+    # 行がなければ作成し、あれば何もしない（同時に同じキーを作っても一意制約違反にしない）。executemany 1回で送る
+    # returning を渡すと、RETURNING が使える DB では実際に作成した行だけを返す（それ以外は空のリスト）
+    if not rows:
+        return []
+    name = db.bind.dialect.name
+    dialect_insert = _dialect_insert(name)
+    if dialect_insert is None:
+        for row in rows:
+            where = and_(*(table.c[k] == row[k] for k in keys))
+            if (await db.execute(select(table.c[keys[0]]).where(where))).first() is None:
+                await db.execute(insert(table).values(**row))
+        return []
+    stmt = dialect_insert(table)
+    if name == "mysql":
+        # INSERT IGNORE は一意制約以外のエラーも警告にしてしまうので、重複時だけ何もしない更新にする
+        stmt = stmt.on_duplicate_key_update({keys[0]: table.c[keys[0]]})
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+    if returning is not None and name != "mysql" and db.bind.dialect.insert_executemany_returning:
+        return (await db.execute(stmt.returning(*returning), rows)).fetchall()
+    await db.execute(stmt, rows)
+    return []
@@ -1,10 +1,97 @@
+import itertools
+import logging
+import time
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from core.config import DATABASE_URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from core.config import REPLICA_RETRY_SECONDS, DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_ECHO
 
-def get_engine(database_url=None):
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # 接続の空きを待たされた回数と時間を記録するプール（プール枯渇の兆候を見る）
+    # 空いている接続を取るだけ・新しく接続するだけの取り出しは数えない（接続の確立にかかる時間も含めない）
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _must_wait(self) -> bool:
+        # 空きがなく、オーバーフロー分も使い切っていれば、返却されるまでキューで待つことになる
+        return self.checkedin() == 0 and self._max_overflow > -1 and self._overflow >= self._max_overflow
+
+    def _do_get(self):
+        if not self._must_wait():
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.waits += 1
+            self.wait_seconds += elapsed
+            self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+
+# 名前 -> engine（プール統計の取得用）
+engines = {}
+
+def get_engine(database_url=None, name="primary"):
     url = database_url or DATABASE_URL
-    return create_async_engine(url, echo=True, future=True)
+    options = {"echo": DB_ECHO, "future": True, "pool_pre_ping": DB_POOL_PRE_PING}
+    parsed = make_url(url)
+    # インメモリ SQLite は単一接続のプールになるのでサイズ指定はしない
+    if not (parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")):
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    engine = create_async_engine(url, **options)
+    _track_pool(engine)
+    engines[name] = engine
+    return engine
+
+def _track_pool(engine):
+    # engine に登録したプールイベントはプールを作り直しても引き継がれる
+    counters = engine.sync_engine.pool_counters = {"connects": 0, "checkouts": 0}
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        counters["connects"] += 1
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        counters["checkouts"] += 1
+
+def pool_stats(engine) -> dict:
+    pool = engine.sync_engine.pool
+    stats = {"pool": type(pool).__name__}
+    stats.update(getattr(engine.sync_engine, "pool_counters", {}))
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            waits=pool.waits,
+            wait_seconds_total=round(pool.wait_seconds, 6),
+            wait_seconds_max=round(pool.max_wait_seconds, 6),
+            timeouts=pool.timeouts,
+        )
+    return stats
 
 def get_session_maker(engine):
     return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -12,3 +99,48 @@ def get_session_maker(engine):
 async def get_db(session_maker):  # 必ずsession_makerを渡す
     async with session_maker() as session:
         yield session
+
+async def get_read_db(db: AsyncSession = Depends(get_db)):
+    # 読み取り専用の get_db。レプリカが設定されていれば main.py で差し替える
+    yield db
+
+logger = logging.getLogger(__name__)
+
+class ReplicaRouter:
+    # レプリカをラウンドロビンで選び、接続できないものはしばらく外してプライマリに戻す
+    def __init__(self, primary_maker, replica_makers, retry_seconds=REPLICA_RETRY_SECONDS):
+        self.primary_maker = primary_maker
+        self.replicas = [(f"replica{i + 1}", maker) for i, maker in enumerate(replica_makers)]
+        self.retry_seconds = retry_seconds
+        self.down_until = {}
+        self._next = itertools.count()
+
+    def candidates(self):
+        now = time.monotonic()
+        if self.replicas:
+            start = next(self._next) % len(self.replicas)
+            for name, maker in self.replicas[start:] + self.replicas[:start]:
+                if self.down_until.get(name, 0) <= now:
+                    yield name, maker
+        yield "primary", self.primary_maker
+
+    def mark_down(self, name):
+        self.down_until[name] = time.monotonic() + self.retry_seconds
+
+    async def session(self):
+        for name, maker in self.candidates():
+            session = maker()
+            if name == "primary":
+                break
+            try:
+                # 先に接続を確保して（pre_ping 込み）、死んでいるレプリカを検出する
+                await session.connection()
+                break
+            except (DBAPIError, OSError):
+                logger.warning("replica %s is unavailable; falling back", name, exc_info=True)
+                await session.close()
+                self.mark_down(name)
+        try:
+            yield session
+        finally:
+            await session.close()
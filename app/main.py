@@ -1,17 +1,39 @@
 from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from routers import public, admin
-from app.database.session import get_engine, get_session_maker, get_db
+from app.database.session import get_engine, get_session_maker, get_db, get_read_db, ReplicaRouter
+from app.core.config import DATABASE_REPLICA_URLS, METRICS_ENABLED
+from app.core.metrics import MetricsMiddleware, install_query_tracking, metrics
 
 engine = get_engine()
 session_maker = get_session_maker(engine)
 
+replica_engines = [get_engine(url, name=f"replica{i + 1}") for i, url in enumerate(DATABASE_REPLICA_URLS)]
+read_router = ReplicaRouter(session_maker, [get_session_maker(e) for e in replica_engines])
+
 app = FastAPI()
 
-# 依存性注入の使い方例
-def get_db_for_app():
-    return get_db(session_maker)
+# ルートごとのリクエスト数・レイテンシ・SQL 実行数（/metrics で Prometheus 形式）
+if METRICS_ENABLED:
+    install_query_tracking()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# 依存性注入の使い方例（async generator 関数として渡す）
+async def get_db_for_app():
+    async for session in get_db(session_maker):
+        yield session
+
+async def get_read_db_for_app():
+    async for session in read_router.session():
+        yield session
 
 app.dependency_overrides[get_db] = get_db_for_app
+if replica_engines:
+    app.dependency_overrides[get_read_db] = get_read_db_for_app
 
 # router登録等はそのまま
 app.include_router(public.router)
@@ -0,0 +1,35 @@
+# campsites.created_version（ETag 用。作成した書き込みのカタログのバージョン）を既存の DB に追加する
+#   cd app && python -m migrations.add_created_version --database-url sqlite+aiosqlite:///campsites.db
+# 既存の行は 0 になる（これから作る行は必ずそれより大きいので、同じ id で作り直しても ETag は重ならない）
+import argparse
+import asyncio
+import sys
+from typing import List, Optional
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+async def add_created_version(db: AsyncSession) -> bool:
+    conn = await db.connection()
+    columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("campsites"))
+    if any(c["name"] == "created_version" for c in columns):
+        return False
+    await db.execute(text("ALTER TABLE campsites ADD COLUMN created_version INTEGER NOT NULL DEFAULT 0"))
+    await db.commit()
+    return True
+
+async def _main(args) -> None:
+    engine = create_async_engine(args.database_url, future=True)
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as db:
+        added = await add_created_version(db)
+    await engine.dispose()
+    print("added campsites.created_version" if added else "campsites.created_version already exists", file=sys.stderr)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="add campsites.created_version to an existing database")
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///campsites.db")
+    asyncio.run(_main(parser.parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# 旧 campsites.tags（カンマ区切り文字列）を tags / campsite_tags テーブルへ移す
+#   cd app && python -m migrations.backfill_tags --database-url sqlite+aiosqlite:///campsites.db
+# 何度実行しても同じ結果になる（campsite_tags に行があるキャンプ場は移行済みとして飛ばす）
+# 全件移したことを確認してから --drop-column で旧カラムを削除する
+import argparse
+import asyncio
+import sys
+from typing import List, Optional
+from sqlalchemy import column, inspect, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from database.base import Base
+from models.tag import DBCampsiteTag, DBTag
+from core.etag import bump_catalog_version
+from core.facets import rebuild_facets
+from core.tags import add_tags_bulk, normalize_tags
+
+TAG_MAX_LENGTH = DBTag.__table__.c.name.type.length
+
+# モデルからは削除済みのカラムなので、ここだけで参照する
+legacy_campsites = table("campsites", column("id"), column("tags"))
+
+async def has_legacy_column(db: AsyncSession) -> bool:
+    conn = await db.connection()
+    columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("campsites"))
+    return any(c["name"] == "tags" for c in columns)
+
+async def backfill_tags(db: AsyncSession, batch_size: int = 1000) -> dict:
+    report = {"campsites": 0, "skipped_tags": 0}
+    if not await has_legacy_column(db):
+        return report
+    last_id = 0
+    while True:
+        # id 順にページングし、バッチごとに commit する（途中で止めても再実行で続きから移せる）
+        result = await db.execute(
+            select(legacy_campsites.c.id, legacy_campsites.c.tags)
+            .where(legacy_campsites.c.id > last_id, legacy_campsites.c.tags.is_not(None), legacy_campsites.c.tags != "")
+            .where(legacy_campsites.c.id.not_in(select(DBCampsiteTag.campsite_id)))
+            .order_by(legacy_campsites.c.id)
+            .limit(batch_size)
+        )
+        rows = result.fetchall()
+        if not rows:
+            break
+        tags_by_id = {}
+        for row in rows:
+            names = normalize_tags(row.tags.split(","))
+            # tags.name に入らない長さのタグは移さない（件数だけ報告する）
+            tags_by_id[row.id] = [n for n in names if len(n) <= TAG_MAX_LENGTH]
+            report["skipped_tags"] += len(names) - len(tags_by_id[row.id])
+        await add_tags_bulk(db, tags_by_id)
+        await db.commit()
+        report["campsites"] += len(rows)
+        last_id = rows[-1].id
+    # タグのファセットとキャッシュ用のバージョンを移行後のデータに合わせる
+    await rebuild_facets(db)
+    await bump_catalog_version(db)
+    await db.commit()
+    return report
+
+async def drop_legacy_column(db: AsyncSession) -> bool:
+    if not await has_legacy_column(db):
+        return False
+    await db.execute(text("ALTER TABLE campsites DROP COLUMN tags"))
+    await db.commit()
+    return True
+
+async def _main(args) -> None:
+    engine = create_async_engine(args.database_url, future=True)
+    if args.create_tables:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as db:
+        report = await backfill_tags(db, args.batch_size)
+        print(f"copied tags of {report['campsites']:,} campsites ({report['skipped_tags']:,} tags longer than {TAG_MAX_LENGTH} skipped)", file=sys.stderr)
+        if args.drop_column and await drop_legacy_column(db):
+            print("dropped campsites.tags", file=sys.stderr)
+    await engine.dispose()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="copy legacy comma-separated campsites.tags into the tags tables")
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///campsites.db")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--create-tables", action="store_true", help="create the tags tables if they are missing")
+    parser.add_argument("--drop-column", action="store_true", help="drop campsites.tags after copying")
+    asyncio.run(_main(parser.parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
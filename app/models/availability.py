@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, LargeBinary, ForeignKey
+from database.base import Base
+
+# キャンプ場ごと・年ごとの空き状況（1行で1年分。core/availability.py）
+class DBCampsiteAvailability(Base):
+    __tablename__ = "campsite_availability"
+
+    campsite_id = Column(Integer, ForeignKey("campsites.id", ondelete="CASCADE"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    capacity = Column(LargeBinary, nullable=False)  # 1日1バイトの空き枠数（元日から順に 365/366 日分）
+    available = Column(LargeBinary, nullable=False)  # 空き枠が1以上の日のビットマップ（bit i = 元日から i 日目）
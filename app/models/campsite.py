@@ -1,8 +1,18 @@
-from sqlalchemy import Column, Integer, String, Boolean
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Boolean, Float, Index, DateTime
 from database.base import Base
 
 class DBCampsite(Base):
     __tablename__ = "campsites"
+    # 一覧のよくある「絞り込み + 並び替え」をインデックスだけで LIMIT まで処理できるようにする
+    # pet_friendly（真偽値）だけの絞り込みは並び替えのキーのインデックスをたどって読み捨てる（専用のインデックスは持たない）
+    __table_args__ = (
+        Index("ix_campsites_pref_pet_price", "prefecture", "pet_friendly", "price_min"),
+        Index("ix_campsites_pref_price", "prefecture", "price_min"),
+        Index("ix_campsites_price_min", "price_min"),
+        Index("ix_campsites_pref_name", "prefecture", "name"),
+        Index("ix_campsites_pref_id", "prefecture", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
@@ -12,5 +22,11 @@ class DBCampsite(Base):
     price_min = Column(Integer)
     price_max = Column(Integer)
     pet_friendly = Column(Boolean)
-    tags = Column(String)  # comma-separated
-    
\ No newline at end of file
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True, index=True)  # 近傍検索用のセル（core/geo.py）
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # 更新のたびに +1（ETag 用）
+    # 作成した書き込みのカタログのバージョン。削除後に同じ id で作り直されても ETag が変わるようにする
+    created_version = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # タグは tags / campsite_tags テーブル（models/tag.py）で管理する
@@ -0,0 +1,9 @@
+from sqlalchemy import Column, Integer
+from database.base import Base
+
+# カタログ全体のバージョン（管理APIで書き込むたびに +1）。一覧の ETag に使う
+class DBCatalogVersion(Base):
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
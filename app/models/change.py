@@ -0,0 +1,13 @@
+from datetime import datetime
+from sqlalchemy import Boolean, Column, DateTime, Integer
+from database.base import Base
+
+# 管理APIによるキャンプ場の変更履歴（差分同期用。core/changes.py）
+# 削除も行を残すので、削除済みの id を墓標として配信できる
+class DBCampsiteChange(Base):
+    __tablename__ = "campsite_changes"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)  # 同期トークンの中身（単調増加）
+    campsite_id = Column(Integer, nullable=False, index=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
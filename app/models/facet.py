@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, String
+from database.base import Base
+
+# 絞り込みなしのファセット件数（管理APIの書き込みごとに差分で更新する）
+class DBCampsiteFacet(Base):
+    __tablename__ = "campsite_facets"
+
+    facet = Column(String(32), primary_key=True)  # total / prefecture / pet_friendly / tag
+    value = Column(String(64), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, String, ForeignKey
+from database.base import Base
+
+# キーワード検索用の bi-gram 転置インデックス（gram -> campsite_id のポスティング）
+class DBCampsiteNgram(Base):
+    __tablename__ = "campsite_ngrams"
+
+    gram = Column(String(2), primary_key=True)
+    campsite_id = Column(Integer, ForeignKey("campsites.id", ondelete="CASCADE"), primary_key=True, index=True)
+    score = Column(Integer)  # フィールドの重み付き出現回数
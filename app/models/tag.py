@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from database.base import Base
+
+class DBTag(Base):
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(64), unique=True, index=True)
+
+class DBCampsiteTag(Base):
+    __tablename__ = "campsite_tags"
+    # タグからキャンプ場を引くための (tag_id, campsite_id) インデックス
+    __table_args__ = (Index("ix_campsite_tags_tag_id_campsite_id", "tag_id", "campsite_id"),)
+
+    campsite_id = Column(Integer, ForeignKey("campsites.id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer)  # 登録時のタグの並び順
@@ -1,14 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.user import DBUser
 from models.campsite import DBCampsite
+from models.ngram import DBCampsiteNgram
+from models.tag import DBCampsiteTag
 from schemas.user import Token
-from schemas.campsite import Campsite, CampsiteCreate
-from core.security import create_access_token, verify_token
-from database.session import get_db
-import hashlib
+from schemas.availability import AvailabilityUpdate
+from schemas.campsite import Campsite, CampsiteBulkTarget, CampsiteBulkUpdate, CampsiteCreate, CampsiteUpdate, campsite_from_row
+from core.hashing import password_hasher
+from core.security import create_access_token, decode_token, oauth2_scheme, principal_cache, revoke_token, verify_token
+from core.config import AVAILABILITY_MAX_ITEMS, IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS
+from core.availability import check_period, delete_availability, set_availability
+from core.bulk import import_campsites, insert_batch, iter_csv, iter_lines, iter_ndjson
+from core.cache import campsite_cache, invalidate_all, invalidate_campsite
+from core.changes import change_notifier, prune_changes, record_changes
+from core.etag import bump_catalog_version
+from core.facets import apply_facet_delta, counts_for_ids, facet_delta, rebuild_facets
+from core.filters import filter_conditions
+from core.search import index_campsite, unindex_campsite, rebuild_index
+from core.geo import geohash_for
+from core.tags import clear_campsite_tags, load_tags, normalize_tags, parse_tags_column, set_campsite_tags, tags_column
+from database.session import engines, get_db, pool_stats
+from collections import Counter
 from datetime import timedelta
+from typing import Literal
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -18,50 +35,215 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     user = result.fetchone()
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    hashed_input = hashlib.sha256(form_data.password.encode()).hexdigest()
-    if user.hashed_password != hashed_input:
+    if not await password_hasher.verify(form_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+    if password_hasher.needs_rehash(user.hashed_password):
+        # 旧形式（sha256）のハッシュはログイン成功時に bcrypt へ置き換える
+        hashed = await password_hasher.hash(form_data.password)
+        await db.execute(DBUser.__table__.update().where(DBUser.id == user.id).values(hashed_password=hashed))
+        await db.commit()
     access_token = create_access_token(data={"sub": user.username}, expires_delta=timedelta(minutes=60))
     return {"access_token": access_token, "token_type": "bearer"}
 
+@router.post("/token/revoke")
+async def revoke_access_token(token: str = Depends(oauth2_scheme), username: str = Depends(verify_token)):
+    # 現在のトークンを失効させる（ログアウト）
+    payload = decode_token(token)
+    if payload.get("jti"):
+        revoke_token(payload["jti"], payload["exp"])
+    await principal_cache.delete((username, payload.get("jti")))
+    return {"message": "Revoked"}
+
 @router.post("/campsites", response_model=Campsite)
 async def create_campsite(campsite: CampsiteCreate, db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
-    db_campsite = DBCampsite(
-        name=campsite.name,
-        description=campsite.description,
-        location=campsite.location,
-        prefecture=campsite.prefecture,
-        price_min=campsite.price_min,
-        price_max=campsite.price_max,
-        pet_friendly=campsite.pet_friendly,
-        tags=','.join(campsite.tags)
-    )
-    db.add(db_campsite)
-    await db.commit()
-    await db.refresh(db_campsite)
-    return db_campsite
+    # 一括インポートと同じ経路で登録する（登録後に読み直さず、送られた値から応答を作る）
+    ids = await insert_batch(db, [campsite])
+    return Campsite(**dict(campsite.dict(), id=ids[0], tags=normalize_tags(campsite.tags)))
+
+def _select_with_tags(campsite_id: int):
+    # 行とタグを1回のクエリで読む
+    return select(DBCampsite.__table__, tags_column()).where(DBCampsite.id == campsite_id)
 
 @router.put("/campsites/{campsite_id}", response_model=Campsite)
 async def update_campsite(campsite_id: int, campsite: CampsiteCreate, db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
-    result = await db.execute(DBCampsite.__table__.select().where(DBCampsite.id == campsite_id))
+    result = await db.execute(_select_with_tags(campsite_id))
     db_campsite = result.fetchone()
     if not db_campsite:
         raise HTTPException(status_code=404, detail="Campsite not found")
-    update_data = campsite.dict()
-    if "tags" in update_data:
-        update_data["tags"] = ','.join(update_data["tags"])
-    await db.execute(DBCampsite.__table__.update().where(DBCampsite.id == campsite_id).values(**update_data))
+    update_data = campsite.dict(exclude={"tags"})
+    update_data["geohash"] = geohash_for(campsite.latitude, campsite.longitude)
+    await db.execute(DBCampsite.__table__.update().where(DBCampsite.id == campsite_id).values(**update_data, version=DBCampsite.version + 1))
+    await index_campsite(db, campsite_id, campsite.name, campsite.description, campsite.location)
+    tags = await set_campsite_tags(db, campsite_id, campsite.tags)
+    old = campsite_from_row(db_campsite, parse_tags_column(db_campsite.tags)).dict()
+    await apply_facet_delta(db, facet_delta(removed=[old], added=[dict(campsite.dict(), tags=tags)]))
+    version = await bump_catalog_version(db)
+    await record_changes(db, [campsite_id])
     await db.commit()
-    result = await db.execute(DBCampsite.__table__.select().where(DBCampsite.id == campsite_id))
-    updated = result.fetchone()
+    updated = Campsite(**dict(campsite.dict(), id=campsite_id, tags=tags))
+    await invalidate_campsite(campsite_id, old, updated.dict(), catalog_version=version)
+    change_notifier.notify()
     return updated
 
+@router.patch("/campsites/{campsite_id}", response_model=Campsite)
+async def patch_campsite(campsite_id: int, changes: CampsiteUpdate, db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
+    result = await db.execute(_select_with_tags(campsite_id))
+    db_campsite = result.fetchone()
+    if not db_campsite:
+        raise HTTPException(status_code=404, detail="Campsite not found")
+    old = campsite_from_row(db_campsite, parse_tags_column(db_campsite.tags))
+    update_data = changes.dict(exclude_unset=True)
+    new = Campsite(**dict(old.dict(), **update_data))
+    tags = update_data.pop("tags", None)
+    if "latitude" in update_data or "longitude" in update_data:
+        update_data["geohash"] = geohash_for(new.latitude, new.longitude)
+    await db.execute(DBCampsite.__table__.update().where(DBCampsite.id == campsite_id).values(**update_data, version=DBCampsite.version + 1))
+    if {"name", "description", "location"} & update_data.keys():
+        await index_campsite(db, campsite_id, new.name, new.description, new.location)
+    if tags is not None:
+        new.tags = await set_campsite_tags(db, campsite_id, tags)
+    await apply_facet_delta(db, facet_delta(removed=[old.dict()], added=[new.dict()]))
+    version = await bump_catalog_version(db)
+    await record_changes(db, [campsite_id])
+    await db.commit()
+    await invalidate_campsite(campsite_id, old.dict(), new.dict(), catalog_version=version)
+    change_notifier.notify()
+    return new
+
+def _bulk_where(target: CampsiteBulkTarget):
+    # ids か filter のどちらか一方で対象を指定する（条件なしの全件指定は受け付けない）
+    if (target.ids is None) == (target.filter is None):
+        raise HTTPException(status_code=400, detail="Specify either ids or filter")
+    if target.ids is not None:
+        return lambda stmt: stmt.where(DBCampsite.id.in_(target.ids))
+    # 実際に付く条件で判定する（空白だけのキーワードや空のタグは条件にならず、全件が対象になってしまう）
+    conditions = filter_conditions(target.filter)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Filter must not be empty")
+    return lambda stmt: stmt.where(*conditions)
+
+@router.post("/campsites/bulk-update")
+async def bulk_update_campsites(body: CampsiteBulkUpdate, db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
+    where = _bulk_where(body)
+    values = body.changes.dict(exclude_unset=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="No changes")
+    # 変更履歴に載せるため、対象 id を先に確定させてから更新する
+    ids = (await db.execute(where(select(DBCampsite.id)))).scalars().all()
+    if not ids:
+        return {"updated": 0}
+    facets_changed = bool({"prefecture", "pet_friendly"} & values.keys())
+    if facets_changed:
+        # ファセットに影響する場合は更新前後の件数の差分を反映する
+        before = await counts_for_ids(db, ids)
+    result = await db.execute(DBCampsite.__table__.update().where(DBCampsite.id.in_(ids)).values(**values, version=DBCampsite.version + 1))
+    if facets_changed:
+        delta = await counts_for_ids(db, ids)
+        delta.subtract(before)
+        await apply_facet_delta(db, delta)
+    version = await bump_catalog_version(db)
+    await record_changes(db, ids)
+    await db.commit()
+    await invalidate_all(version)
+    change_notifier.notify()
+    return {"updated": result.rowcount}
+
+@router.post("/campsites/bulk-delete")
+async def bulk_delete_campsites(body: CampsiteBulkTarget, db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
+    where = _bulk_where(body)
+    # タグで絞り込む場合もあるので、先に対象 id を確定させてから関連テーブルごと消す
+    result = await db.execute(where(select(DBCampsite.id)))
+    ids = result.scalars().all()
+    if not ids:
+        return {"deleted": 0}
+    delta = Counter()
+    delta.subtract(await counts_for_ids(db, ids))
+    await apply_facet_delta(db, delta)
+    await db.execute(delete(DBCampsiteTag).where(DBCampsiteTag.campsite_id.in_(ids)))
+    await db.execute(delete(DBCampsiteNgram).where(DBCampsiteNgram.campsite_id.in_(ids)))
+    await delete_availability(db, ids)
+    result = await db.execute(DBCampsite.__table__.delete().where(DBCampsite.id.in_(ids)))
+    version = await bump_catalog_version(db)
+    await record_changes(db, ids, deleted=True)
+    await db.commit()
+    await invalidate_all(version)
+    change_notifier.notify()
+    return {"deleted": result.rowcount}
+
 @router.delete("/campsites/{campsite_id}")
 async def delete_campsite(campsite_id: int, db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
-    result = await db.execute(DBCampsite.__table__.select().where(DBCampsite.id == campsite_id))
-    db_campsite = result.fetchone()
+    table = DBCampsite.__table__
+    if db.bind.dialect.delete_returning:
+        # 削除した行は RETURNING で受け取る（事前の SELECT を省く）
+        # RETURNING 内の相関サブクエリは列名が修飾されず使えないので、タグは先に読んでおく
+        old_tags = (await load_tags(db, [campsite_id]))[campsite_id]
+        result = await db.execute(table.delete().where(DBCampsite.id == campsite_id).returning(*table.c))
+        db_campsite = result.fetchone()
+    else:
+        result = await db.execute(_select_with_tags(campsite_id))
+        db_campsite = result.fetchone()
+        if db_campsite:
+            old_tags = parse_tags_column(db_campsite.tags)
+            await db.execute(table.delete().where(DBCampsite.id == campsite_id))
     if not db_campsite:
         raise HTTPException(status_code=404, detail="Campsite not found")
-    await db.execute(DBCampsite.__table__.delete().where(DBCampsite.id == campsite_id))
+    old = campsite_from_row(db_campsite, old_tags).dict()
+    await unindex_campsite(db, campsite_id)
+    await clear_campsite_tags(db, campsite_id)
+    await delete_availability(db, [campsite_id])
+    await apply_facet_delta(db, facet_delta(removed=[old]))
+    version = await bump_catalog_version(db)
+    await record_changes(db, [campsite_id], deleted=True)
     await db.commit()
+    await invalidate_campsite(campsite_id, old, catalog_version=version)
+    change_notifier.notify()
     return {"message": "Deleted"}
+
+@router.put("/availability")
+async def update_availability(body: AvailabilityUpdate, db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
+    # 期間ごとの空き枠数をまとめて設定する（キャンプ場×年の行を一度に読み書きする）
+    if len(body.items) > AVAILABILITY_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items (max {AVAILABILITY_MAX_ITEMS})")
+    for item in body.items:
+        check_period(item.start, item.end)
+    updated, unknown = await set_availability(db, [(i.campsite_id, i.start, i.end, i.capacity) for i in body.items])
+    await db.commit()
+    return {"updated": updated, "unknown_campsite_ids": unknown}
+
+@router.post("/campsites/import")
+async def import_campsites_endpoint(request: Request, format: Literal["ndjson", "csv"] = "ndjson", batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000), db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
+    # 本文はストリームのまま読み、行ごとに検証してバッチで INSERT する
+    lines = iter_lines(request.stream())
+    records = iter_csv(lines) if format == "csv" else iter_ndjson(lines)
+    return await import_campsites(db, records, batch_size, IMPORT_MAX_ERRORS)
+
+@router.get("/cache/stats")
+async def cache_stats(token: str = Depends(verify_token)):
+    return campsite_cache.stats()
+
+@router.get("/db/pool")
+async def db_pool_stats(token: str = Depends(verify_token)):
+    # engine ごとのプール統計（使用中・オーバーフロー・待ち時間）
+    return {name: pool_stats(engine) for name, engine in engines.items()}
+
+@router.post("/search/reindex")
+async def reindex_campsites(db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
+    # 既存データから転置インデックスを作り直す
+    count = await rebuild_index(db)
+    await db.commit()
+    return {"indexed": count}
+
+@router.post("/changes/prune")
+async def prune_change_log(db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
+    # 保持期間（CHANGES_RETENTION_DAYS）より古い変更履歴を削除する。それより古いトークンの差分同期は 410 になる
+    count = await prune_changes(db)
+    await db.commit()
+    return {"pruned": count}
+
+@router.post("/facets/rebuild")
+async def rebuild_facet_counts(db: AsyncSession = Depends(get_db), token: str = Depends(verify_token)):
+    # ファセットのサマリテーブルを全件から作り直す
+    count = await rebuild_facets(db)
+    await bump_catalog_version(db)
+    await db.commit()
+    return {"total": count}
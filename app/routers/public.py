@@ -1,65 +1,255 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.user import DBUser
 from models.campsite import DBCampsite
 from schemas.user import UserCreate
-from schemas.campsite import Campsite, CampsiteCreate
-from database.session import get_db
-import hashlib
-from typing import Optional, List
+from schemas.availability import AvailabilityDay
+from schemas.campsite import Campsite, CampsiteBatch, CampsiteBatchRequest, CampsiteChanges, CampsiteFacets, CampsiteFilter, CampsitePage, NearbyCampsite, campsite_dict
+from database.session import get_db, get_read_db
+from core.config import AVAILABILITY_MAX_NIGHTS, BATCH_MAX_IDS, CHANGES_PAGE_SIZE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, EXPORT_CHUNK_SIZE, NEARBY_MAX_RADIUS_KM
+from core.fields import campsite_columns, campsite_fields, wants_tags
+from core.filters import campsite_filter, apply_campsite_filter, filter_key
+from core.cache import cache_if_current, campsite_cache, detail_key, list_key
+from core.pagination import apply_keyset, cursor_for, decode_cursor, encode_cursor
+from core.changes import change_events, change_page, check_token_age, latest_seq, parse_change_token
+from core.availability import availability_window, check_period, check_stay, check_window, find_available, get_calendar
+from core.hashing import password_hasher
+from core.facets import facet_counts
+from core.etag import ETAG_COLUMNS, campsite_etag, campsite_revision, catalog_version, catalog_version_column, etag_matches, json_with_etag, list_etag, not_modified
+from core.loader import CampsiteLoader, get_campsite_loader
+from core.geo import cover_cells, haversine_km
+from core.search import keyword_scores
+from core.serialization import JSONBytesResponse, dumps
+from core.tags import load_tags, parse_tags_column, tags_column
+import csv
+import heapq
+import io
+from datetime import date, timedelta
+from typing import Literal, Optional, List
 
 router = APIRouter(prefix="/api", tags=["public"])
 
+# users.username の一意制約違反のメッセージに含まれる語（SQLite は列名、MySQL / PostgreSQL はインデックス名）
+USERNAME_UNIQUE_NAMES = ("users.username", "ix_users_username")
+UNIQUE_VIOLATION_MARKERS = ("UNIQUE constraint failed", "Duplicate entry", "duplicate key value")
+
+def _duplicate_username(exc: IntegrityError) -> bool:
+    message = str(exc.orig)
+    return any(m in message for m in UNIQUE_VIOLATION_MARKERS) and any(n in message for n in USERNAME_UNIQUE_NAMES)
+
 @router.post("/register")
 async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(DBUser.__table__.select().where(DBUser.username == user.username))
-    existing = result.fetchone()
-    if existing:
+    hashed = await password_hasher.hash(user.password)
+    # 重複は users.username の一意制約で判定する（事前の SELECT をしないので競合しても二重登録にならない）
+    # それ以外の制約違反は重複ではないので、そのままエラーにする
+    try:
+        await db.execute(DBUser.__table__.insert().values(username=user.username, hashed_password=hashed))
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        if not _duplicate_username(exc):
+            raise
         raise HTTPException(status_code=400, detail="Username already exists")
-    hashed = hashlib.sha256(user.password.encode()).hexdigest()
-    new_user = DBUser(username=user.username, hashed_password=hashed)
-    db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
     return {"message": "User registered successfully"}
 
-@router.get("/campsites", response_model=List[Campsite])
-async def list_campsites(keyword: Optional[str] = None, prefecture: Optional[str] = None, pet_friendly: Optional[bool] = None, db: AsyncSession = Depends(get_db)):
-    query = DBCampsite.__table__.select()
-    if keyword:
-        query = query.where(DBCampsite.name.contains(keyword))
-    if prefecture:
-        query = query.where(DBCampsite.prefecture == prefecture)
-    if pet_friendly is not None:
-        query = query.where(DBCampsite.pet_friendly == pet_friendly)
+# 並び替えごとのキーセット（最後に id を付けて順序を一意にする）。料金は price_min で並べる
+SORT_COLUMNS = {
+    "id": [("id", DBCampsite.id, False)],
+    "price_asc": [("price_min", DBCampsite.price_min, False), ("id", DBCampsite.id, False)],
+    "price_desc": [("price_min", DBCampsite.price_min, True), ("id", DBCampsite.id, True)],
+    "name": [("name", DBCampsite.name, False), ("id", DBCampsite.id, False)],
+}
+
+def build_list_query(filters: CampsiteFilter, sort: str, cursor: Optional[str], limit: int, fields: Optional[tuple] = None):
+    # 一覧の SELECT とキーセットの列を組み立てる（実行計画のテストからも使う）
+    scores = keyword_scores(filters.keyword) if sort == "relevance" and filters.keyword else None
+    if scores is not None:
+        # 関連度順: 転置インデックスのスコアを JOIN して並べる
+        table = DBCampsite.__table__
+        query = select(*campsite_columns(fields, DBCampsite.id), scores.c.score).join_from(table, scores, scores.c.campsite_id == DBCampsite.id)
+        query = apply_campsite_filter(query, filters, keyword_joined=True)
+        columns = [("score", scores.c.score, True), ("id", DBCampsite.id, False)]
+    else:
+        columns = SORT_COLUMNS.get(sort, SORT_COLUMNS["id"])
+        # 並び替えキーはカーソルを作るために常に読む
+        query = apply_campsite_filter(select(*campsite_columns(fields, *(col for _, col, _ in columns))), filters)
+    # 1件多く取得して次ページの有無を判定する
+    return apply_keyset(query, columns, cursor).limit(limit + 1), columns
+
+@router.get("/campsites", response_model=CampsitePage)
+async def list_campsites(request: Request, filters: CampsiteFilter = Depends(campsite_filter), sort: Literal["id", "relevance", "price_asc", "price_desc", "name"] = "id", limit: int = Query(DEFAULT_PAGE_SIZE, ge=1), cursor: Optional[str] = None, fields: Optional[tuple] = Depends(campsite_fields), db: AsyncSession = Depends(get_read_db)):
+    # limit は上限で丸める（巨大なページを一度に返さない）
+    limit = min(limit, MAX_PAGE_SIZE)
+    key = list_key(filters, sort, cursor, limit, fields)
+    cached = await campsite_cache.get(key)
+    if cached is not None:
+        etag, body = cached
+        return not_modified(etag) if etag_matches(request, etag) else json_with_etag(body, etag)
+    # カタログのバージョン（1行）だけを見て、変わっていなければ本体のクエリを実行せずに 304
+    version = await catalog_version(db)
+    etag = list_etag(version, key)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    query, columns = build_list_query(filters, sort, cursor, limit, fields)
     result = await db.execute(query)
     rows = result.fetchall()
-    return [Campsite(
-        id=c.id,
-        name=c.name,
-        description=c.description,
-        location=c.location,
-        prefecture=c.prefecture,
-        price_min=c.price_min,
-        price_max=c.price_max,
-        pet_friendly=c.pet_friendly,
-        tags=c.tags.split(",") if c.tags else []
-    ) for c in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = cursor_for(rows[-1], columns)
+    tags = await load_tags(db, [c.id for c in rows]) if wants_tags(fields) else {}
+    body = dumps({"items": [campsite_dict(c, tags.get(c.id), fields) for c in rows], "next_cursor": next_cursor})
+    # バージョンを先に読んでいるので、それが書き込みより古ければ（遅れているレプリカ）キャッシュに載せない
+    await cache_if_current(key, (etag, body), version)
+    return json_with_etag(body, etag)
+
+EXPORT_COLUMNS = ["id", "name", "description", "location", "prefecture", "price_min", "price_max", "pet_friendly", "tags", "latitude", "longitude"]
+
+async def _export_ndjson(result):
+    async for partition in result.partitions():
+        yield b"".join(dumps(campsite_dict(c, parse_tags_column(c.tags))) + b"\n" for c in partition)
+
+async def _export_csv(result):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buf.getvalue()
+    async for partition in result.partitions():
+        buf.seek(0)
+        buf.truncate()
+        for c in partition:
+            writer.writerow([c.id, c.name, c.description, c.location, c.prefecture, c.price_min, c.price_max, c.pet_friendly, ",".join(parse_tags_column(c.tags)), c.latitude, c.longitude])
+        yield buf.getvalue()
+
+@router.get("/campsites/export")
+async def export_campsites(format: Literal["ndjson", "csv"] = "ndjson", filters: CampsiteFilter = Depends(campsite_filter), db: AsyncSession = Depends(get_read_db)):
+    # サーバーサイドカーソルで少しずつ読み出し、全件をメモリに載せない
+    query = apply_campsite_filter(select(DBCampsite.__table__, tags_column()), filters).order_by(DBCampsite.id)
+    result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    if format == "csv":
+        body, media_type = _export_csv(result), "text/csv; charset=utf-8"
+    else:
+        body, media_type = _export_ndjson(result), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f"attachment; filename=campsites.{format}"})
+
+@router.get("/campsites/nearby", response_model=List[NearbyCampsite])
+async def nearby_campsites(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180), radius_km: float = Query(30, gt=0, le=NEARBY_MAX_RADIUS_KM), limit: int = Query(20, ge=1), filters: CampsiteFilter = Depends(campsite_filter), db: AsyncSession = Depends(get_read_db)):
+    limit = min(limit, MAX_PAGE_SIZE)
+    # geohash セルの範囲検索で候補を絞り、正確な距離で上位 limit 件を選ぶ
+    cells = cover_cells(lat, lon, radius_km)
+    query = select(DBCampsite.id, DBCampsite.latitude, DBCampsite.longitude).where(
+        or_(*[and_(DBCampsite.geohash >= cell, DBCampsite.geohash < cell + "~") for cell in cells])
+    )
+    result = await db.execute(apply_campsite_filter(query, filters))
+    candidates = ((haversine_km(lat, lon, c.latitude, c.longitude), c.id) for c in result)
+    nearest = heapq.nsmallest(limit, (d for d in candidates if d[0] <= radius_km))
+    if not nearest:
+        return []
+    ids = [i for _, i in nearest]
+    result = await db.execute(DBCampsite.__table__.select().where(DBCampsite.id.in_(ids)))
+    rows = {c.id: c for c in result}
+    tags = await load_tags(db, ids)
+    return JSONBytesResponse(dumps([
+        dict(campsite_dict(rows[i], tags[i]), distance_km=round(d, 3))
+        for d, i in nearest
+    ]))
+
+@router.get("/campsites/facets", response_model=CampsiteFacets)
+async def campsite_facets(request: Request, filters: CampsiteFilter = Depends(campsite_filter), db: AsyncSession = Depends(get_read_db)):
+    # 都道府県・タグ・ペット可否ごとの件数（一覧と同じ検索条件）
+    etag = list_etag(await catalog_version(db), ("facets", filter_key(filters)))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return json_with_etag(dumps(await facet_counts(db, filters)), etag)
+
+@router.post("/campsites/batch", response_model=CampsiteBatch)
+async def batch_campsites(body: CampsiteBatchRequest, loader: CampsiteLoader = Depends(get_campsite_loader)):
+    # お気に入り・旅程画面用: 複数の id を1リクエスト・IN 1回で取得する
+    ids = list(dict.fromkeys(body.ids))
+    if len(ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {BATCH_MAX_IDS})")
+    entries = await loader.load_many(ids)
+    # キャッシュ済みの詳細 JSON をそのまま連結する
+    items = [entry[1] for entry in entries if entry is not None]
+    missing = [i for i, entry in zip(ids, entries) if entry is None]
+    return JSONBytesResponse(b'{"items":[' + b",".join(items) + b'],"missing":' + dumps(missing) + b"}")
+
+@router.get("/campsites/changes", response_model=CampsiteChanges)
+async def campsite_changes(since: Optional[str] = None, limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=CHANGES_PAGE_SIZE), db: AsyncSession = Depends(get_read_db)):
+    # 差分同期: since 以降に変わった行と削除された id だけを返す（has_more の間は next で続けて取得する）
+    page = await change_page(db, parse_change_token(since) if since else None, limit)
+    return JSONBytesResponse(dumps(page))
+
+@router.get("/campsites/changes/stream")
+async def campsite_change_stream(request: Request, since: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    # 変更を Server-Sent Events で配信する。再接続時はブラウザが送る Last-Event-ID から続ける
+    token = request.headers.get("last-event-id") or since
+    if token:
+        start = parse_change_token(token)
+        # 応答を始めた後では 410 を返せないので、接続時に確かめる
+        await check_token_age(db, start)
+    else:
+        start = await latest_seq(db)
+    return StreamingResponse(change_events(db, start), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/campsites/available", response_model=CampsitePage)
+async def available_campsites(check_in: date, check_out: date, min_capacity: int = Query(1, ge=1, le=255), filters: CampsiteFilter = Depends(campsite_filter), limit: int = Query(DEFAULT_PAGE_SIZE, ge=1), cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    # 宿泊日（check_in 〜 check_out の前日）すべてに空きがあるキャンプ場を id 順に返す
+    # 一覧と同じ条件で絞った id について年ごとのビットマップを読み、範囲のマスクとの AND で判定する
+    check_stay(check_in, check_out)
+    limit = min(limit, MAX_PAGE_SIZE)
+    after_id = None
+    if cursor:
+        after_id = decode_cursor(cursor).get("id")
+        if not isinstance(after_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    campsite_ids = apply_campsite_filter(select(DBCampsite.id), filters)
+    ids = await find_available(db, campsite_ids, check_in, check_out, limit + 1, after_id, min_capacity)
+    next_cursor = None
+    if len(ids) > limit:
+        ids = ids[:limit]
+        next_cursor = encode_cursor({"id": ids[-1]})
+    if not ids:
+        return JSONBytesResponse(dumps({"items": [], "next_cursor": None}))
+    result = await db.execute(DBCampsite.__table__.select().where(DBCampsite.id.in_(ids)))
+    rows = {c.id: c for c in result}
+    tags = await load_tags(db, ids)
+    # 空き状況の読み出しからここまでの間に削除された行は飛ばす
+    return JSONBytesResponse(dumps({"items": [campsite_dict(rows[i], tags[i]) for i in ids if i in rows], "next_cursor": next_cursor}))
+
+@router.get("/campsites/{campsite_id}/availability", response_model=List[AvailabilityDay])
+async def campsite_availability(campsite_id: int, start: date, end: Optional[date] = None, db: AsyncSession = Depends(get_read_db)):
+    # 日ごとの空き枠数（end を含む。省略時は start から AVAILABILITY_MAX_NIGHTS 日分）
+    check_window(start)
+    end = end or min(start + timedelta(days=AVAILABILITY_MAX_NIGHTS - 1), availability_window()[1])
+    check_period(start, end)
+    if (end - start).days >= 366:
+        raise HTTPException(status_code=400, detail="Period is too long (max 366 days)")
+    if await campsite_revision(db, campsite_id) is None:
+        raise HTTPException(status_code=404, detail="Campsite not found")
+    return JSONBytesResponse(dumps(await get_calendar(db, campsite_id, start, end)))
 
 @router.get("/campsites/{campsite_id}", response_model=Campsite)
-async def get_campsite(campsite_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(DBCampsite.__table__.select().where(DBCampsite.id == campsite_id))
+async def get_campsite(request: Request, campsite_id: int, fields: Optional[tuple] = Depends(campsite_fields), db: AsyncSession = Depends(get_read_db)):
+    key = detail_key(campsite_id, fields)
+    cached = await campsite_cache.get(key)
+    if cached is not None:
+        etag, body = cached
+        return not_modified(etag) if etag_matches(request, etag) else json_with_etag(body, etag)
+    if request.headers.get("if-none-match"):
+        # version 列だけを主キーで引いて比較する
+        revision = await campsite_revision(db, campsite_id)
+        if revision is not None and etag_matches(request, campsite_etag(revision, fields)):
+            return not_modified(campsite_etag(revision, fields))
+    result = await db.execute(select(*campsite_columns(fields, *ETAG_COLUMNS), catalog_version_column()).where(DBCampsite.id == campsite_id))
     c = result.fetchone()
     if not c:
         raise HTTPException(status_code=404, detail="Campsite not found")
-    return Campsite(
-        id=c.id,
-        name=c.name,
-        description=c.description,
-        location=c.location,
-        prefecture=c.prefecture,
-        price_min=c.price_min,
-        price_max=c.price_max,
-        pet_friendly=c.pet_friendly,
-        tags=c.tags.split(",") if c.tags else []
-    )
+    tags = await load_tags(db, [c.id]) if wants_tags(fields) else {}
+    body = dumps(campsite_dict(c, tags.get(c.id), fields))
+    etag = campsite_etag(c, fields)
+    await cache_if_current(key, (etag, body), c.catalog_version)
+    return json_with_etag(body, etag)
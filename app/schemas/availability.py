@@ -0,0 +1,17 @@
+from datetime import date
+from typing import List
+from pydantic import BaseModel, Field
+
+class AvailabilityRange(BaseModel):
+    # start〜end（両端を含む）の各日の空き枠数を capacity にする（0 で受付停止）
+    campsite_id: int
+    start: date
+    end: date
+    capacity: int = Field(..., ge=0, le=255)
+
+class AvailabilityUpdate(BaseModel):
+    items: List[AvailabilityRange]
+
+class AvailabilityDay(BaseModel):
+    date: date
+    capacity: int
@@ -1,5 +1,8 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field, constr, validator
+from typing import Dict, List, Literal, Optional, Tuple
+
+# タグ名は tags.name（String(64)）に収まる長さまで
+TagName = constr(max_length=64)
 
 class CampsiteBase(BaseModel):
     name: str
@@ -9,7 +12,9 @@ class CampsiteBase(BaseModel):
     price_min: int
     price_max: int
     pet_friendly: bool
-    tags: List[str] = []
+    tags: List[TagName] = []
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class CampsiteCreate(CampsiteBase):
     pass
@@ -19,3 +24,100 @@ class Campsite(CampsiteBase):
 
     class Config:
         orm_mode = True
+
+class CampsiteFilter(BaseModel):
+    keyword: Optional[str] = None
+    prefecture: Optional[str] = None
+    pet_friendly: Optional[bool] = None
+    tags: Optional[List[str]] = None
+    tag_mode: Literal["any", "all"] = "any"
+    price_gte: Optional[int] = None
+    price_lte: Optional[int] = None
+
+def campsite_dict(c, tags: Optional[List[str]], fields: Optional[Tuple[str, ...]] = None) -> dict:
+    # DB の行とタグ一覧を Campsite と同じ形の dict にする（検証なしの高速パス用）
+    if fields is not None:
+        return {f: tags if f == "tags" else getattr(c, f) for f in fields}
+    return {
+        "name": c.name,
+        "description": c.description,
+        "location": c.location,
+        "prefecture": c.prefecture,
+        "price_min": c.price_min,
+        "price_max": c.price_max,
+        "pet_friendly": c.pet_friendly,
+        "tags": tags,
+        "latitude": c.latitude,
+        "longitude": c.longitude,
+        "id": c.id,
+    }
+
+def campsite_from_row(c, tags: List[str]) -> Campsite:
+    # DB の行とタグ一覧を Campsite に変換する
+    return Campsite(**campsite_dict(c, tags))
+
+def _not_null(value):
+    # 省略はよいが、必須の列に明示的な null は入れさせない（422 にする）
+    if value is None:
+        raise ValueError("must not be null")
+    return value
+
+class CampsiteUpdate(BaseModel):
+    # PATCH 用（送られた項目だけを更新する）
+    name: Optional[str] = None
+    description: Optional[str] = None
+    location: Optional[str] = None
+    prefecture: Optional[str] = None
+    price_min: Optional[int] = None
+    price_max: Optional[int] = None
+    pet_friendly: Optional[bool] = None
+    tags: Optional[List[TagName]] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+    _required = validator("name", "location", "prefecture", "price_min", "price_max", "pet_friendly", "tags", pre=True, allow_reuse=True)(_not_null)
+
+class CampsiteBulkChanges(BaseModel):
+    # 一括更新では検索索引・タグに影響しない項目だけを変更できる
+    prefecture: Optional[str] = None
+    price_min: Optional[int] = None
+    price_max: Optional[int] = None
+    pet_friendly: Optional[bool] = None
+
+    _required = validator("prefecture", "price_min", "price_max", "pet_friendly", pre=True, allow_reuse=True)(_not_null)
+
+class CampsiteBulkTarget(BaseModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[CampsiteFilter] = None
+
+class CampsiteBulkUpdate(CampsiteBulkTarget):
+    changes: CampsiteBulkChanges
+
+class CampsitePage(BaseModel):
+    items: List[Campsite]
+    next_cursor: Optional[str] = None
+
+class NearbyCampsite(Campsite):
+    distance_km: float
+
+class CampsiteBatchRequest(BaseModel):
+    ids: List[int]
+
+class CampsiteBatch(BaseModel):
+    # items は要求順（重複は除く）、見つからなかった id は missing に入れる
+    items: List[Campsite]
+    missing: List[int]
+
+class CampsiteFacets(BaseModel):
+    # 値ごとの件数（pet_friendly は "true" / "false"）
+    total: int
+    prefecture: Dict[str, int]
+    pet_friendly: Dict[str, int]
+    tag: Dict[str, int]
+
+class CampsiteChanges(BaseModel):
+    # since のトークン以降に登録・更新された行と、削除された id。次回は next を since に渡す
+    updated: List[Campsite]
+    deleted: List[int]
+    next: str
+    has_more: bool
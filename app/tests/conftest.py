@@ -1,10 +1,20 @@
+import pytest
 import pytest_asyncio
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from httpx import AsyncClient
 from app.main import app
 from app.database.base import Base
 from app.database.session import get_db
+from app.core.cache import campsite_cache, catalog_watermark
+from app.core.security import principal_cache, revoked_tokens
+from app.core.hashing import password_hasher
+from app.benchmarks.dataset import load_dataset
+
+# テストでは bcrypt のコストを最小にする
+password_hasher.rounds = 4
 
 ASYNC_DB_URL = "sqlite+aiosqlite:///:memory:"
 
@@ -14,6 +24,12 @@ async def async_client():
     engine = create_async_engine(ASYNC_DB_URL, echo=False, future=True)
     TestingSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+    # テストごとにDBが変わるのでキャッシュも空にする
+    await campsite_cache.clear()
+    catalog_watermark.reset()
+    await principal_cache.clear()
+    revoked_tokens.clear()
+
     # テスト用DBの初期化
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
@@ -31,3 +47,58 @@ async def async_client():
         yield ac
 
     await engine.dispose()
+
+@pytest_asyncio.fixture(scope="function")
+async def admin_headers(async_client):
+    # 管理者ユーザーを作成してトークン付きヘッダーを返す
+    await async_client.post("/api/register", json={
+        "username": "fixtureadmin",
+        "password": "fixturepass"
+    })
+    resp = await async_client.post("/api/admin/token", data={
+        "username": "fixtureadmin",
+        "password": "fixturepass"
+    })
+    token = resp.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+class QueryCounter:
+    # テスト中に実行された SQL 文を数える（Engine クラスに登録するのでテスト用 engine も対象）
+    def __init__(self):
+        self.statements = []
+        self.executions = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        # 実行計画のテスト用に、executemany 以外はパラメータも残す
+        if not executemany:
+            self.executions.append((statement, parameters))
+
+    def reset(self):
+        self.statements = []
+        self.executions = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+@pytest.fixture
+def query_counter():
+    counter = QueryCounter()
+    event.listen(Engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(Engine, "before_cursor_execute", counter)
+
+@pytest_asyncio.fixture(scope="function")
+async def synthetic_dataset(async_client):
+    # テスト用DBに合成データを入れる関数を返す（例: await synthetic_dataset(campsites=1000, seed=1)）
+    sessions = []
+
+    async def load(campsites: int = 1000, users: int = 0, seed: int = 0, **kwargs):
+        session = await anext(app.dependency_overrides[get_db]())
+        sessions.append(session)
+        return await load_dataset(session, campsites, users, seed, **kwargs)
+
+    yield load
+    for session in sessions:
+        await session.close()
@@ -7,4 +7,5 @@ class UserFactory(factory.Factory):
         model = DBUser
 
     id = factory.Sequence(lambda n: n + 1)
-    email = factory.Sequence(lambda n: f"user{n}@example.com")
+    username = factory.Sequence(lambda n: f"user{n}")
+    hashed_password = "!"  # ログインできないダミー値
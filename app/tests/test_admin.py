@@ -1,4 +1,13 @@
+import asyncio
+import json
+from types import SimpleNamespace
 import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.bulk import _insert_campsites
+from app.core.security import invalidate_principal, principal_cache
+from app.database.session import TimedQueuePool, pool_stats
+from app.schemas.campsite import CampsiteCreate
 
 @pytest.mark.asyncio
 async def test_admin_create_campsite(async_client):
@@ -68,3 +77,246 @@ async def test_admin_update_and_delete_campsite(async_client):
     resp = await async_client.delete(f"/api/admin/campsites/{campsite_id}", headers=headers)
     assert resp.status_code == 200
     assert resp.json()["message"] == "Deleted"
+
+@pytest.mark.asyncio
+async def test_admin_write_invalidates_cache(async_client, admin_headers):
+    post_data = {
+        "name": "キャッシュキャンプ場",
+        "location": "静岡県",
+        "prefecture": "静岡",
+        "price_min": 1000,
+        "price_max": 3000,
+        "pet_friendly": True,
+        "tags": []
+    }
+    resp = await async_client.post("/api/admin/campsites", json=post_data, headers=admin_headers)
+    campsite_id = resp.json()["id"]
+
+    # 1回目はミス、2回目はヒット
+    await async_client.get(f"/api/campsites/{campsite_id}")
+    await async_client.get("/api/campsites", params={"prefecture": "静岡"})
+    await async_client.get("/api/campsites", params={"prefecture": "北海道"})
+    resp = await async_client.get(f"/api/campsites/{campsite_id}")
+    assert resp.json()["name"] == "キャッシュキャンプ場"
+    stats = (await async_client.get("/api/admin/cache/stats", headers=admin_headers)).json()
+    assert stats["hits"] == 1
+    assert stats["size"] == 3
+
+    # 更新で詳細と「静岡」の一覧だけが外れる（「北海道」の一覧はヒットのまま）
+    update_data = dict(post_data, name="更新キャッシュ")
+    await async_client.put(f"/api/admin/campsites/{campsite_id}", json=update_data, headers=admin_headers)
+    resp = await async_client.get(f"/api/campsites/{campsite_id}")
+    assert resp.json()["name"] == "更新キャッシュ"
+    resp = await async_client.get("/api/campsites", params={"prefecture": "静岡"})
+    assert resp.json()["items"][0]["name"] == "更新キャッシュ"
+    await async_client.get("/api/campsites", params={"prefecture": "北海道"})
+    stats = (await async_client.get("/api/admin/cache/stats", headers=admin_headers)).json()
+    assert (stats["hits"], stats["misses"]) == (2, 5)
+
+    # 削除後は 404
+    await async_client.delete(f"/api/admin/campsites/{campsite_id}", headers=admin_headers)
+    resp = await async_client.get(f"/api/campsites/{campsite_id}")
+    assert resp.status_code == 404
+
+@pytest.mark.asyncio
+async def test_admin_import_ndjson(async_client, admin_headers):
+    rows = [
+        {"name": f"インポート{i}", "location": "北海道", "prefecture": "北海道", "price_min": 1000, "price_max": 2000, "pet_friendly": True, "tags": ["湖", "星空"]}
+        for i in range(5)
+    ]
+    lines = [json.dumps(r, ensure_ascii=False) for r in rows]
+    lines.insert(2, '{"name": "不正な行"}')
+    lines.insert(4, "not json")
+    body = "\n".join(lines).encode()
+
+    resp = await async_client.post("/api/admin/campsites/import", params={"batch_size": 2}, content=body, headers=admin_headers)
+    assert resp.status_code == 200
+    report = resp.json()
+    assert report["inserted"] == 5
+    assert report["failed"] == 2
+    assert [e["line"] for e in report["errors"]] == [3, 5]
+
+    resp = await async_client.get("/api/campsites", params={"tag": "星空", "keyword": "インポート"})
+    items = resp.json()["items"]
+    assert len(items) == 5
+    assert items[0]["tags"] == ["湖", "星空"]
+
+    # ファセットのサマリもバッチごとに加算される
+    facets = (await async_client.get("/api/campsites/facets")).json()
+    assert facets["total"] == 5
+    assert facets["tag"] == {"星空": 5, "湖": 5}
+
+@pytest.mark.asyncio
+async def test_admin_import_csv_roundtrip(async_client, admin_headers):
+    body = (
+        "name,description,location,prefecture,price_min,price_max,pet_friendly,tags,latitude,longitude\n"
+        'CSVキャンプ場,"改行を含む\n説明",山梨県,山梨,3000,5000,true,"富士山,絶景",35.5,138.7\n'
+        "価格不正,,山梨県,山梨,abc,5000,true,,,\n"
+    ).encode()
+    resp = await async_client.post("/api/admin/campsites/import", params={"format": "csv"}, content=body, headers=admin_headers)
+    report = resp.json()
+    assert report["inserted"] == 1
+    assert report["errors"][0]["line"] == 4
+
+    # エクスポートした CSV をそのまま取り込める
+    exported = (await async_client.get("/api/campsites/export", params={"format": "csv"})).content
+    resp = await async_client.post("/api/admin/campsites/import", params={"format": "csv"}, content=exported, headers=admin_headers)
+    assert resp.json()["inserted"] == 1
+    items = (await async_client.get("/api/campsites", params={"keyword": "CSV"})).json()["items"]
+    assert len(items) == 2
+    assert items[1]["description"] == "改行を含む\n説明"
+    assert items[1]["tags"] == ["富士山", "絶景"]
+    assert items[1]["latitude"] == 35.5
+
+@pytest.mark.asyncio
+async def test_mysql_insert_ids_follow_auto_increment_increment():
+    # MySQL は lastrowid（先頭行の id）から auto_increment_increment 刻みで割り当てる（MySQL がなくても確かめられるよう DB を模す）
+    class MySQLSession:
+        bind = SimpleNamespace(dialect=SimpleNamespace(name="mysql", insert_executemany_returning_sort_by_parameter_order=False))
+
+        async def execute(self, statement, *args):
+            if "auto_increment_increment" in str(statement):
+                return SimpleNamespace(scalar=lambda: 2)
+            return SimpleNamespace(lastrowid=11)
+
+    campsites = [CampsiteCreate(name=f"刻み{i}", location="長野県", prefecture="長野", price_min=1, price_max=2, pet_friendly=True) for i in range(3)]
+    assert await _insert_campsites(MySQLSession(), campsites, 1) == [11, 13, 15]
+
+@pytest.mark.asyncio
+async def test_admin_patch_campsite(async_client, admin_headers):
+    resp = await async_client.post("/api/admin/campsites", json={
+        "name": "パッチ前",
+        "description": "説明",
+        "location": "千葉県",
+        "prefecture": "千葉",
+        "price_min": 1000,
+        "price_max": 2000,
+        "pet_friendly": False,
+        "tags": ["海"]
+    }, headers=admin_headers)
+    campsite_id = resp.json()["id"]
+
+    resp = await async_client.patch(f"/api/admin/campsites/{campsite_id}", json={"price_min": 1500, "name": "パッチ後"}, headers=admin_headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["price_min"] == 1500
+    assert body["name"] == "パッチ後"
+    assert body["description"] == "説明"
+    assert body["tags"] == ["海"]
+
+    # 検索索引も更新されている
+    resp = await async_client.get("/api/campsites", params={"keyword": "パッチ後"})
+    assert len(resp.json()["items"]) == 1
+
+    resp = await async_client.patch("/api/admin/campsites/9999", json={"price_min": 1}, headers=admin_headers)
+    assert resp.status_code == 404
+
+    # 必須の項目に null は送れない（省略できる description・緯度経度は null で消せる）
+    for changes in ({"name": None}, {"tags": None}, {"pet_friendly": None}):
+        resp = await async_client.patch(f"/api/admin/campsites/{campsite_id}", json=changes, headers=admin_headers)
+        assert resp.status_code == 422
+    # タグ名は tags.name の長さ（64文字）まで
+    resp = await async_client.patch(f"/api/admin/campsites/{campsite_id}", json={"tags": ["x" * 65]}, headers=admin_headers)
+    assert resp.status_code == 422
+    resp = await async_client.patch(f"/api/admin/campsites/{campsite_id}", json={"tags": ["x" * 64]}, headers=admin_headers)
+    assert resp.status_code == 200
+    resp = await async_client.patch(f"/api/admin/campsites/{campsite_id}", json={"description": None}, headers=admin_headers)
+    assert resp.status_code == 200
+    assert resp.json()["description"] is None
+
+@pytest.mark.asyncio
+async def test_admin_bulk_update_and_delete(async_client, admin_headers):
+    ids = []
+    for i in range(4):
+        resp = await async_client.post("/api/admin/campsites", json={
+            "name": f"一括{i}",
+            "location": "テスト",
+            "prefecture": "山梨" if i < 3 else "長野",
+            "price_min": 1000,
+            "price_max": 2000,
+            "pet_friendly": False,
+            "tags": ["一括"]
+        }, headers=admin_headers)
+        ids.append(resp.json()["id"])
+
+    resp = await async_client.post("/api/admin/campsites/bulk-update", json={"ids": ids[:2], "changes": {"price_min": 1200}}, headers=admin_headers)
+    assert resp.json() == {"updated": 2}
+    resp = await async_client.post("/api/admin/campsites/bulk-update", json={"filter": {"prefecture": "山梨"}, "changes": {"pet_friendly": True}}, headers=admin_headers)
+    assert resp.json() == {"updated": 3}
+    resp = await async_client.get("/api/campsites", params={"pet_friendly": True, "price_lte": 1100})
+    assert [c["name"] for c in resp.json()["items"]] == ["一括2"]
+    # 必須の列を null にする一括更新は拒否
+    resp = await async_client.post("/api/admin/campsites/bulk-update", json={"ids": ids[:1], "changes": {"prefecture": None}}, headers=admin_headers)
+    assert resp.status_code == 422
+    resp = await async_client.get(f"/api/campsites/{ids[0]}")
+    assert resp.json()["prefecture"] == "山梨"
+
+    # 条件なし・実際には条件にならない指定（空のタグ・空白だけのキーワード）は拒否
+    for target in ({}, {"tags": []}, {"tags": ["  "]}, {"keyword": "   "}):
+        resp = await async_client.post("/api/admin/campsites/bulk-delete", json={"filter": target}, headers=admin_headers)
+        assert resp.status_code == 400, target
+        resp = await async_client.post("/api/admin/campsites/bulk-update", json={"filter": target, "changes": {"price_max": 1}}, headers=admin_headers)
+        assert resp.status_code == 400, target
+    resp = await async_client.post("/api/admin/campsites/bulk-delete", json={"filter": {"tags": ["一括"], "tag_mode": "none"}}, headers=admin_headers)
+    assert resp.status_code == 422
+    resp = await async_client.get("/api/campsites", params={"tag": "一括"})
+    assert len(resp.json()["items"]) == 4
+
+    resp = await async_client.post("/api/admin/campsites/bulk-delete", json={"filter": {"prefecture": "山梨", "tags": ["一括"]}}, headers=admin_headers)
+    assert resp.json() == {"deleted": 3}
+    resp = await async_client.get("/api/campsites", params={"tag": "一括"})
+    assert [c["name"] for c in resp.json()["items"]] == ["一括3"]
+
+@pytest.mark.asyncio
+async def test_admin_principal_cache_and_revoke(async_client, admin_headers):
+    # 2回目以降の管理APIはキャッシュから認証する
+    await async_client.get("/api/admin/cache/stats", headers=admin_headers)
+    await async_client.get("/api/admin/cache/stats", headers=admin_headers)
+    stats = principal_cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+    # ユーザー単位で無効化すると再度DBを引く
+    await invalidate_principal("fixtureadmin")
+    assert principal_cache.stats()["size"] == 0
+
+    resp = await async_client.post("/api/admin/token/revoke", headers=admin_headers)
+    assert resp.status_code == 200
+    resp = await async_client.get("/api/admin/cache/stats", headers=admin_headers)
+    assert resp.status_code == 401
+
+@pytest.mark.asyncio
+async def test_admin_db_pool_stats(async_client, admin_headers):
+    resp = await async_client.get("/api/admin/db/pool", headers=admin_headers)
+    assert resp.status_code == 200
+    primary = resp.json()["primary"]
+    assert primary["pool"] == "TimedQueuePool"
+    assert {"size", "checked_out", "overflow", "waits", "wait_seconds_max"} <= primary.keys()
+    # 他のテストで作った engine は残っていない
+    assert not [name for name in resp.json() if name.startswith("test-")]
+
+@pytest.mark.asyncio
+async def test_pool_counts_only_blocked_checkouts(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=5)
+    # 空きのある取り出しは待ちに数えない
+    for _ in range(5):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    assert pool_stats(engine)["waits"] == 0
+
+    # 1本しかない接続を使用中に取り出すと、返却まで待つ
+    async def hold():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await asyncio.sleep(0.1)
+
+    async def wait():
+        await asyncio.sleep(0.02)
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(hold(), wait())
+    stats = pool_stats(engine)
+    assert stats["waits"] == 1
+    assert stats["wait_seconds_max"] >= 0.05
+    await engine.dispose()
@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+from datetime import date
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import AVAILABILITY_MAX_ITEMS, AVAILABILITY_MAX_YEARS_AHEAD
+from app.core.availability import bitmap_bytes, days_in_year, get_calendar, pack_bitmap, range_masks, set_availability, stay_matches
+from app.database.base import Base
+from app.models.campsite import DBCampsite
+
+YEAR = date.today().year + 1
+
+def _campsite(name: str, prefecture: str, pet_friendly: bool) -> dict:
+    return {"name": name, "location": f"{prefecture}県", "prefecture": prefecture, "price_min": 1000, "price_max": 2000, "pet_friendly": pet_friendly, "tags": []}
+
+def test_range_masks_split_by_year():
+    # 年をまたぐ宿泊は年ごとのマスクに分かれる（check_out の日は含まない）
+    masks = range_masks(date(2023, 12, 30), date(2024, 1, 3))
+    assert masks == {2023: 0b11 << 363, 2024: 0b11}
+    # うるう年の 12/31 は 365 番目のビット
+    assert range_masks(date(2024, 12, 31), date(2025, 1, 1)) == {2024: 1 << 365}
+
+def test_stay_matches_bitmap_and_capacity():
+    capacity = bytearray(days_in_year(2023))
+    capacity[10:15] = bytes([1, 3, 3, 0, 3])
+    row = (bitmap_bytes(pack_bitmap(capacity), 2023), bytes(capacity))
+    assert stay_matches({2023: row}, range_masks(date(2023, 1, 11), date(2023, 1, 14)), 1)
+    assert not stay_matches({2023: row}, range_masks(date(2023, 1, 11), date(2023, 1, 15)), 1)
+    # 必要な枠数が 2 以上なら空き枠数から判定する
+    assert stay_matches({2023: row}, range_masks(date(2023, 1, 12), date(2023, 1, 14)), 2)
+    assert not stay_matches({2023: row}, range_masks(date(2023, 1, 11), date(2023, 1, 14)), 2)
+    # 行がない年は空きなし
+    assert not stay_matches({}, range_masks(date(2023, 1, 11), date(2023, 1, 12)), 1)
+
+@pytest.mark.asyncio
+async def test_availability_search(async_client, admin_headers):
+    ids = []
+    for name, prefecture, pet in [("A", "長野", True), ("B", "長野", False), ("C", "山梨", True), ("D", "長野", True)]:
+        resp = await async_client.post("/api/admin/campsites", json=_campsite(name, prefecture, pet), headers=admin_headers)
+        ids.append(resp.json()["id"])
+    a, b, c, d = ids
+
+    resp = await async_client.put("/api/admin/availability", json={"items": [
+        {"campsite_id": a, "start": f"{YEAR}-07-01", "end": f"{YEAR}-07-31", "capacity": 5},
+        {"campsite_id": a, "start": f"{YEAR}-07-15", "end": f"{YEAR}-07-15", "capacity": 0},
+        {"campsite_id": b, "start": f"{YEAR}-07-01", "end": f"{YEAR}-07-31", "capacity": 2},
+        {"campsite_id": c, "start": f"{YEAR}-07-01", "end": f"{YEAR}-07-31", "capacity": 2},
+        {"campsite_id": d, "start": f"{YEAR}-07-01", "end": f"{YEAR}-07-10", "capacity": 1},
+        {"campsite_id": 999999, "start": f"{YEAR}-07-01", "end": f"{YEAR}-07-02", "capacity": 1},
+    ]}, headers=admin_headers)
+    assert resp.status_code == 200
+    assert resp.json() == {"updated": 4, "unknown_campsite_ids": [999999]}
+
+    async def search(**params):
+        resp = await async_client.get("/api/campsites/available", params=params)
+        assert resp.status_code == 200
+        return [item["name"] for item in resp.json()["items"]]
+
+    assert await search(check_in=f"{YEAR}-07-08", check_out=f"{YEAR}-07-10") == ["A", "B", "C", "D"]
+    # 7/15 は A が満室、7/11 以降は D の空きがない
+    assert await search(check_in=f"{YEAR}-07-14", check_out=f"{YEAR}-07-16") == ["B", "C"]
+    # check_out の日は宿泊しないので含まない
+    assert await search(check_in=f"{YEAR}-07-09", check_out=f"{YEAR}-07-11") == ["A", "B", "C", "D"]
+    # 一覧と同じ絞り込み条件・必要な枠数
+    assert await search(check_in=f"{YEAR}-07-08", check_out=f"{YEAR}-07-10", prefecture="長野", pet_friendly="true") == ["A", "D"]
+    assert await search(check_in=f"{YEAR}-07-08", check_out=f"{YEAR}-07-10", min_capacity=2) == ["A", "B", "C"]
+    # 空き状況のない期間
+    assert await search(check_in=f"{YEAR}-08-01", check_out=f"{YEAR}-08-02") == []
+
+    # id 順のカーソルでページング
+    resp = await async_client.get("/api/campsites/available", params={"check_in": f"{YEAR}-07-08", "check_out": f"{YEAR}-07-10", "limit": 3})
+    body = resp.json()
+    assert [item["name"] for item in body["items"]] == ["A", "B", "C"]
+    resp = await async_client.get("/api/campsites/available", params={"check_in": f"{YEAR}-07-08", "check_out": f"{YEAR}-07-10", "limit": 3, "cursor": body["next_cursor"]})
+    assert [item["name"] for item in resp.json()["items"]] == ["D"]
+    assert resp.json()["next_cursor"] is None
+
+    resp = await async_client.get("/api/campsites/available", params={"check_in": f"{YEAR}-07-10", "check_out": f"{YEAR}-07-10"})
+    assert resp.status_code == 400
+    resp = await async_client.get("/api/campsites/available", params={"check_in": f"{YEAR}-07-01", "check_out": f"{YEAR}-09-01"})
+    assert resp.status_code == 400
+
+    # 日ごとの空き枠数
+    resp = await async_client.get(f"/api/campsites/{a}/availability", params={"start": f"{YEAR}-07-14", "end": f"{YEAR}-07-16"})
+    assert resp.json() == [
+        {"date": f"{YEAR}-07-14", "capacity": 5},
+        {"date": f"{YEAR}-07-15", "capacity": 0},
+        {"date": f"{YEAR}-07-16", "capacity": 5},
+    ]
+    resp = await async_client.get("/api/campsites/999999/availability", params={"start": f"{YEAR}-07-14"})
+    assert resp.status_code == 404
+
+    # キャンプ場を削除すると空き状況も消える
+    await async_client.delete(f"/api/admin/campsites/{a}", headers=admin_headers)
+    assert await search(check_in=f"{YEAR}-07-08", check_out=f"{YEAR}-07-10") == ["B", "C", "D"]
+
+@pytest.mark.asyncio
+async def test_availability_across_years(async_client, admin_headers):
+    resp = await async_client.post("/api/admin/campsites", json=_campsite("年越し", "長野", True), headers=admin_headers)
+    campsite_id = resp.json()["id"]
+    await async_client.put("/api/admin/availability", json={"items": [
+        {"campsite_id": campsite_id, "start": f"{YEAR}-12-28", "end": f"{YEAR + 1}-01-02", "capacity": 1},
+    ]}, headers=admin_headers)
+    resp = await async_client.get("/api/campsites/available", params={"check_in": f"{YEAR}-12-30", "check_out": f"{YEAR + 1}-01-03"})
+    assert [item["id"] for item in resp.json()["items"]] == [campsite_id]
+    resp = await async_client.get("/api/campsites/available", params={"check_in": f"{YEAR}-12-30", "check_out": f"{YEAR + 1}-01-04"})
+    assert resp.json()["items"] == []
+
+@pytest.mark.asyncio
+async def test_availability_dates_outside_window(async_client, admin_headers):
+    resp = await async_client.post("/api/admin/campsites", json=_campsite("範囲外", "長野", True), headers=admin_headers)
+    campsite_id = resp.json()["id"]
+    # 日付の計算があふれる年・遠い過去は 500 ではなく 400
+    resp = await async_client.get("/api/campsites/available", params={"check_in": "9999-12-30", "check_out": "9999-12-31"})
+    assert resp.status_code == 400
+    resp = await async_client.get(f"/api/campsites/{campsite_id}/availability", params={"start": "9999-12-30"})
+    assert resp.status_code == 400
+    resp = await async_client.put("/api/admin/availability", json={"items": [
+        {"campsite_id": campsite_id, "start": "0001-01-01", "end": "0001-01-02", "capacity": 1},
+    ]}, headers=admin_headers)
+    assert resp.status_code == 400
+    # 期間の最終日に泊まる場合は翌年の元日に check_out できる
+    last_year = date.today().year + AVAILABILITY_MAX_YEARS_AHEAD
+    await async_client.put("/api/admin/availability", json={"items": [
+        {"campsite_id": campsite_id, "start": f"{last_year}-12-31", "end": f"{last_year}-12-31", "capacity": 1},
+    ]}, headers=admin_headers)
+    resp = await async_client.get("/api/campsites/available", params={"check_in": f"{last_year}-12-31", "check_out": f"{last_year + 1}-01-01"})
+    assert [item["id"] for item in resp.json()["items"]] == [campsite_id]
+    resp = await async_client.get(f"/api/campsites/{campsite_id}/availability", params={"start": f"{last_year}-12-31"})
+    assert resp.json() == [{"date": f"{last_year}-12-31", "capacity": 1}]
+
+@pytest.mark.asyncio
+async def test_availability_item_limit(async_client, admin_headers):
+    item = {"campsite_id": 1, "start": f"{YEAR}-07-01", "end": f"{YEAR}-07-01", "capacity": 1}
+    resp = await async_client.put("/api/admin/availability", json={"items": [item] * (AVAILABILITY_MAX_ITEMS + 1)}, headers=admin_headers)
+    assert resp.status_code == 400
+
+@pytest.mark.asyncio
+async def test_concurrent_availability_updates(tmp_path):
+    # 同じキャンプ場・同じ年への同時の書き込みで、片方の更新が消えたり一意制約違反になったりしない
+    # （インメモリ DB は接続を共有するので、別々の接続を持てるファイルの DB で試す）
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'availability.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(DBCampsite), [{"id": 1, "name": "同時", "location": "長野県", "prefecture": "長野", "price_min": 1000, "price_max": 2000, "pet_friendly": True}])
+    maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def put(day: date, capacity: int):
+        async with maker() as db:
+            await set_availability(db, [(1, day, day, capacity)])
+            # 読み取りから書き込みまでの間に相手の書き込みが入り込む余地を作る
+            await asyncio.sleep(0.05)
+            await db.commit()
+
+    # 行がない年（両方が作成しようとする）と、行がある年（両方が読んで書き換える）の両方
+    await asyncio.gather(put(date(YEAR, 3, 1), 5), put(date(YEAR, 4, 1), 7))
+    await asyncio.gather(put(date(YEAR, 5, 1), 2), put(date(YEAR, 6, 1), 3))
+    async with maker() as db:
+        days = {d["date"]: d["capacity"] for d in await get_calendar(db, 1, date(YEAR, 1, 1), date(YEAR, 12, 31))}
+    assert [days[f"{YEAR}-0{m}-01"] for m in (3, 4, 5, 6)] == [5, 7, 2, 3]
+    await engine.dispose()
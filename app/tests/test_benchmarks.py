@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.benchmarks.load import DatabaseNotEmpty, compare, percentile, run
+from app.database.base import Base
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+
+def test_compare_reports_regressions():
+    baseline = {"routes": {"GET /api/campsites": {"rps": 100.0, "p95_ms": 10.0, "errors": 0}}}
+    ok = {"routes": {"GET /api/campsites": {"rps": 95.0, "p95_ms": 11.0, "errors": 0}}}
+    slow = {"routes": {"GET /api/campsites": {"rps": 50.0, "p95_ms": 20.0, "errors": 0}}}
+    assert compare(ok, baseline, 0.2) == []
+    assert len(compare(slow, baseline, 0.2)) == 2
+
+@pytest.mark.asyncio
+async def test_load_benchmark_smoke():
+    # 少量のデータで全ルートがエラーなく回ること
+    report = await run(campsites=30, users=2, requests=5, concurrency=2)
+    assert report["config"]["campsites"] == 30
+    for name, r in report["routes"].items():
+        assert r["errors"] == 0, name
+        assert r["rps"] > 0
+
+@pytest.mark.asyncio
+async def test_load_benchmark_keeps_existing_data(tmp_path):
+    # 指定された DB にデータがあれば、--reset-database なしでは消さずに止まる
+    url = f"sqlite+aiosqlite:///{tmp_path / 'existing.db'}"
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text("INSERT INTO users (username, hashed_password) VALUES ('keep', '!')"))
+    with pytest.raises(DatabaseNotEmpty):
+        await run(campsites=5, users=1, requests=1, concurrency=1, database_url=url)
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("SELECT username FROM users"))).scalars().all() == ["keep"]
+    await engine.dispose()
@@ -0,0 +1,54 @@
+import pytest
+from app.core.cache import CacheBackend, CatalogWatermark, LRUCache, list_buckets, row_buckets
+from app.schemas.campsite import CampsiteFilter
+
+@pytest.mark.asyncio
+async def test_lru_cache_eviction_and_counters():
+    cache = LRUCache(max_entries=2, ttl=60)
+    await cache.set("a", 1)
+    await cache.set("b", 2)
+    assert await cache.get("a") == 1
+    # "b" が最も古いので追い出される
+    await cache.set("c", 3)
+    assert await cache.get("b") is None
+    assert await cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+@pytest.mark.asyncio
+async def test_lru_cache_ttl():
+    cache = LRUCache(max_entries=10, ttl=-1)
+    await cache.set("a", 1)
+    assert await cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_cache_backend_must_implement_interface():
+    # 未実装のメソッドがあるバックエンドは使う前（生成時）に失敗する
+    class PartialCache(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialCache()
+
+def test_invalidation_advances_only_row_buckets():
+    # 書き込みは行が一致しうるバケットの世代だけを進める（キャッシュのキーは走査しない）
+    watermark = CatalogWatermark()
+    shizuoka = list_buckets(CampsiteFilter(prefecture="静岡"))
+    tagged = list_buckets(CampsiteFilter(tags=["海", "森"], tag_mode="all"))
+    watermark.advance(1, row_buckets({"prefecture": "北海道", "pet_friendly": True, "tags": ["森"]}))
+    assert [watermark.generation(b) for b in shizuoka] == [0]
+    assert {b[1]: watermark.generation(b) for b in tagged} == {"海": 0, "森": 1}
+    assert watermark.generation(("*",)) == 1
+
+def test_generations_are_bounded():
+    # 記録しきれないバケットは追い出した世代とみなす（古いキーは外れる側に倒れる）
+    watermark = CatalogWatermark(max_generations=2)
+    watermark.advance(1, [("tag", "海")])
+    watermark.advance(2, [("tag", "森"), ("tag", "湖")])
+    assert watermark.generation(("tag", "海")) == 1
+    assert watermark.generation(("prefecture", "山梨")) == 1
+    watermark.advance_all(3)
+    assert watermark.generation(("tag", "森")) == 3
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import pytest
+from app.core import changes
+
+def _campsite(name: str) -> dict:
+    return {"name": name, "location": "長野県", "prefecture": "長野", "price_min": 1000, "price_max": 2000, "pet_friendly": True, "tags": ["森"]}
+
+async def _create(async_client, admin_headers, name: str) -> int:
+    resp = await async_client.post("/api/admin/campsites", json=_campsite(name), headers=admin_headers)
+    return resp.json()["id"]
+
+@pytest.mark.asyncio
+async def test_changes_since_token(async_client, admin_headers):
+    # SQLite は末尾の id を再利用するので、削除する行を先に作る
+    removed = await _create(async_client, admin_headers, "削除予定")
+    kept = await _create(async_client, admin_headers, "変更前")
+    # since なしは現在のトークンだけ
+    resp = await async_client.get("/api/campsites/changes")
+    body = resp.json()
+    assert body["updated"] == [] and body["deleted"] == []
+    token = body["next"]
+
+    await async_client.patch(f"/api/admin/campsites/{kept}", json={"name": "変更後"}, headers=admin_headers)
+    await async_client.patch(f"/api/admin/campsites/{kept}", json={"price_min": 1500}, headers=admin_headers)
+    await async_client.delete(f"/api/admin/campsites/{removed}", headers=admin_headers)
+    added = await _create(async_client, admin_headers, "新規")
+
+    resp = await async_client.get("/api/campsites/changes", params={"since": token})
+    assert resp.status_code == 200
+    body = resp.json()
+    # 同じ行の複数回の変更は最新の状態1件にまとまる
+    assert [(c["id"], c["name"], c["price_min"], c["tags"]) for c in body["updated"]] == [(kept, "変更後", 1500, ["森"]), (added, "新規", 1000, ["森"])]
+    assert body["deleted"] == [removed]
+    assert body["has_more"] is False
+
+    # 変更がなければ空で、トークンは進まない
+    resp = await async_client.get("/api/campsites/changes", params={"since": body["next"]})
+    assert resp.json() == {"updated": [], "deleted": [], "next": body["next"], "has_more": False}
+
+    # 一括更新・一括削除も履歴に載る
+    await async_client.post("/api/admin/campsites/bulk-update", json={"ids": [kept, added], "changes": {"pet_friendly": False}}, headers=admin_headers)
+    await async_client.post("/api/admin/campsites/bulk-delete", json={"ids": [added]}, headers=admin_headers)
+    resp = await async_client.get("/api/campsites/changes", params={"since": body["next"]})
+    body = resp.json()
+    assert [(c["id"], c["pet_friendly"]) for c in body["updated"]] == [(kept, False)]
+    assert body["deleted"] == [added]
+
+    resp = await async_client.get("/api/campsites/changes", params={"since": "not-a-token"})
+    assert resp.status_code == 400
+
+@pytest.mark.asyncio
+async def test_changes_pagination(async_client, admin_headers):
+    token = (await async_client.get("/api/campsites/changes")).json()["next"]
+    ids = [await _create(async_client, admin_headers, f"キャンプ場{i}") for i in range(5)]
+    seen = []
+    while True:
+        resp = await async_client.get("/api/campsites/changes", params={"since": token, "limit": 2})
+        body = resp.json()
+        seen += [c["id"] for c in body["updated"]]
+        token = body["next"]
+        if not body["has_more"]:
+            break
+    assert seen == ids
+
+@pytest.mark.asyncio
+async def test_change_stream(async_client, admin_headers, monkeypatch):
+    monkeypatch.setattr(changes, "CHANGES_STREAM_MAX_SECONDS", 0.3)
+    monkeypatch.setattr(changes, "CHANGES_POLL_SECONDS", 0.1)
+    token = (await async_client.get("/api/campsites/changes")).json()["next"]
+    created = await _create(async_client, admin_headers, "配信")
+    removed = await _create(async_client, admin_headers, "配信後に削除")
+    await async_client.delete(f"/api/admin/campsites/{removed}", headers=admin_headers)
+
+    # テストのクライアントは応答を最後まで読むので、接続は CHANGES_STREAM_MAX_SECONDS で閉じる
+    resp = await async_client.get("/api/campsites/changes/stream", params={"since": token})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = [e for e in resp.text.split("\n\n") if e.startswith("id: ")]
+    assert len(events) == 1
+    page = json.loads(events[0].split("data: ", 1)[1])
+    assert [c["id"] for c in page["updated"]] == [created]
+    assert page["deleted"] == [removed]
+    assert ": keep-alive" in resp.text
+    # イベントの id は次回の since（Last-Event-ID）に使える
+    last_id = events[0].split("\n")[0][len("id: "):]
+    assert last_id == page["next"]
+    resp = await async_client.get("/api/campsites/changes/stream", headers={"Last-Event-ID": last_id})
+    assert "event: changes" not in resp.text
+
+@pytest.mark.asyncio
+async def test_change_notifier_wakes_waiters():
+    notifier = changes.ChangeNotifier()
+    assert await notifier.wait(notifier.seq, 0.01) is False
+    waiter = asyncio.ensure_future(notifier.wait(notifier.seq, 1))
+    await asyncio.sleep(0)
+    notifier.notify()
+    assert await waiter is True
+
+@pytest.mark.asyncio
+async def test_change_notifier_keeps_notifications_while_reading():
+    # DB を読んでいる間（seq を覚えた後、待つ前）に届いた通知で、すぐに起きる
+    notifier = changes.ChangeNotifier()
+    seen = notifier.seq
+    notifier.notify()
+    assert await asyncio.wait_for(notifier.wait(seen, 5), 0.5) is True
+    assert await notifier.wait(notifier.seq, 0.01) is False
+
+@pytest.mark.asyncio
+async def test_prune_changes_and_stale_token(async_client, admin_headers, monkeypatch):
+    stale = (await async_client.get("/api/campsites/changes")).json()["next"]
+    first = await _create(async_client, admin_headers, "古い変更")
+    await async_client.patch(f"/api/admin/campsites/{first}", json={"price_min": 1100}, headers=admin_headers)
+    recent = (await async_client.get("/api/campsites/changes")).json()["next"]
+    last = await _create(async_client, admin_headers, "新しい変更")
+
+    # 保持期間内の履歴は消えない
+    resp = await async_client.post("/api/admin/changes/prune", headers=admin_headers)
+    assert resp.json() == {"pruned": 0}
+    monkeypatch.setattr(changes, "CHANGES_RETENTION_DAYS", 0)
+    resp = await async_client.post("/api/admin/changes/prune", headers=admin_headers)
+    monkeypatch.undo()
+    # 最新の1件は残す
+    assert resp.json() == {"pruned": 2}
+
+    # 削除した履歴より前のトークンでは差分を作れない
+    resp = await async_client.get("/api/campsites/changes", params={"since": stale})
+    assert resp.status_code == 410
+    resp = await async_client.get("/api/campsites/changes/stream", params={"since": stale})
+    assert resp.status_code == 410
+    # 残っている履歴の直前のトークンからは続けられる
+    resp = await async_client.get("/api/campsites/changes", params={"since": recent})
+    assert [c["id"] for c in resp.json()["updated"]] == [last]
@@ -0,0 +1,44 @@
+import pytest
+from app.benchmarks.dataset import PREFECTURES, TAGS, generate_campsites
+from app.tests.factories import UserFactory
+
+def test_generate_campsites_is_deterministic():
+    first = list(generate_campsites(200, seed=7))
+    assert first == list(generate_campsites(200, seed=7))
+    assert first != list(generate_campsites(200, seed=8))
+    assert [c["id"] for c in first] == list(range(1, 201))
+
+def test_generate_campsites_distribution():
+    rows = list(generate_campsites(5000, seed=1))
+    prefectures = {c["prefecture"] for c in rows}
+    # 件数の多い県ほど多く、47都道府県がひととおり出る
+    assert prefectures <= {p.short for p in PREFECTURES}
+    assert len(prefectures) == 47
+    count = lambda pref: sum(c["prefecture"] == pref for c in rows)
+    assert count("北海道") > count("香川")
+    # タグの人気は先頭ほど高い
+    tag_count = lambda tag: sum(tag in c["tags"] for c in rows)
+    assert tag_count(TAGS[0]) > tag_count(TAGS[10]) > tag_count(TAGS[-1])
+    assert all(c["price_min"] <= c["price_max"] for c in rows)
+    assert all(len(c["tags"]) == len(set(c["tags"])) for c in rows)
+
+def test_user_factory_matches_model():
+    user = UserFactory.build()
+    assert user.username.startswith("user")
+    assert user.hashed_password
+
+@pytest.mark.asyncio
+async def test_synthetic_dataset_fixture(async_client, synthetic_dataset):
+    report = await synthetic_dataset(campsites=300, users=3, seed=3, batch_size=100, search_index=True)
+    assert report == {"campsites": 300, "users": 3, "first_id": 1}
+
+    facets = (await async_client.get("/api/campsites/facets")).json()
+    assert facets["total"] == 300
+    page = (await async_client.get("/api/campsites", params={"prefecture": "北海道", "limit": 200})).json()
+    assert len(page["items"]) == facets["prefecture"]["北海道"]
+    resp = await async_client.post("/api/admin/token", data={"username": "user0000001", "password": "password"})
+    assert resp.status_code == 200
+
+    # 追加で読み込むと id は続きから振られる
+    report = await synthetic_dataset(campsites=10, seed=4)
+    assert report["first_id"] == 301
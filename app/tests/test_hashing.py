@@ -0,0 +1,31 @@
+import asyncio
+import hashlib
+import pytest
+from fastapi import HTTPException
+from app.core.hashing import PasswordHasher
+
+@pytest.mark.asyncio
+async def test_hash_and_verify():
+    hasher = PasswordHasher(workers=2, rounds=4)
+    hashed = await hasher.hash("secret")
+    assert hashed.startswith("$2")
+    assert await hasher.verify("secret", hashed)
+    assert not await hasher.verify("wrong", hashed)
+    assert not hasher.needs_rehash(hashed)
+
+@pytest.mark.asyncio
+async def test_verify_legacy_sha256():
+    hasher = PasswordHasher(rounds=4)
+    legacy = hashlib.sha256(b"secret").hexdigest()
+    assert await hasher.verify("secret", legacy)
+    assert hasher.needs_rehash(legacy)
+
+@pytest.mark.asyncio
+async def test_hash_queue_limit():
+    # 同時実行1・待ち行列1なので、3つ目は即座に 503
+    hasher = PasswordHasher(workers=1, max_queue=1, queue_timeout=5, rounds=10)
+    results = await asyncio.gather(*[hasher.hash("secret") for _ in range(3)], return_exceptions=True)
+    errors = [r for r in results if isinstance(r, HTTPException)]
+    assert len(errors) == 1
+    assert errors[0].status_code == 503
+    assert hasher.stats()["rejected"] == 1
@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.migrations.add_created_version import add_created_version
+
+@pytest.mark.asyncio
+async def test_add_created_version(tmp_path):
+    # created_version がなかった頃の campsites に列を足し、既存の行は 0 にする。2回目は何もしない
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE campsites (id INTEGER PRIMARY KEY, name VARCHAR, version INTEGER NOT NULL DEFAULT 1)"))
+        await conn.execute(text("INSERT INTO campsites (id, name) VALUES (1, '既存')"))
+    maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with maker() as db:
+        assert await add_created_version(db)
+        assert not await add_created_version(db)
+        assert (await db.execute(text("SELECT created_version FROM campsites WHERE id = 1"))).scalar() == 0
+    await engine.dispose()
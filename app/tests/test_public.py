@@ -1,4 +1,17 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
 import pytest
+from sqlalchemy.exc import IntegrityError
+from app.main import app
+from app.core.cache import campsite_cache
+from app.core.loader import CampsiteLoader
+from app.core.metrics import metrics
+from app.database.session import get_db
+from app.models.user import DBUser
+from app.schemas.campsite import CampsitePage
 
 @pytest.mark.asyncio
 async def test_register_and_login(async_client):
@@ -18,7 +31,468 @@ async def test_register_and_login(async_client):
     token = response.json()["access_token"]
     assert token
 
+@pytest.mark.asyncio
+async def test_register_duplicate_and_other_constraint_errors(async_client):
+    # 重複した名前だけが「既に存在する」になり、ほかの制約違反は重複として扱わない
+    user = {"username": "dupuser", "password": "duppass"}
+    assert (await async_client.post("/api/register", json=user)).status_code == 200
+    resp = await async_client.post("/api/register", json=user)
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Username already exists"
+
+    session = await anext(app.dependency_overrides[get_db]())
+    await (await session.connection()).exec_driver_sql("CREATE TRIGGER users_policy BEFORE INSERT ON users BEGIN SELECT RAISE(ABORT, 'CHECK constraint failed: users_policy'); END")
+    await session.commit()
+    with pytest.raises(IntegrityError):
+        await async_client.post("/api/register", json={"username": "other", "password": "otherpass"})
+    await (await session.connection()).exec_driver_sql("DROP TRIGGER users_policy")
+    await session.commit()
+    await session.close()
+
 @pytest.mark.asyncio
 async def test_campsite_list(async_client):
     response = await async_client.get("/api/campsites")
     assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_campsite_list_pagination(async_client, admin_headers):
+    # 5件登録して2件ずつページング
+    for i in range(5):
+        await async_client.post("/api/admin/campsites", json={
+            "name": f"キャンプ場{i}",
+            "location": "長野県",
+            "prefecture": "長野",
+            "price_min": 1000,
+            "price_max": 2000,
+            "pet_friendly": i % 2 == 0,
+            "tags": ["森"]
+        }, headers=admin_headers)
+
+    names = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        resp = await async_client.get("/api/campsites", params=params)
+        assert resp.status_code == 200
+        body = resp.json()
+        assert len(body["items"]) <= 2
+        names += [c["name"] for c in body["items"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert names == [f"キャンプ場{i}" for i in range(5)]
+
+    resp = await async_client.get("/api/campsites", params={"cursor": "not-a-cursor"})
+    assert resp.status_code == 400
+
+@pytest.mark.asyncio
+async def test_campsite_export(async_client, admin_headers):
+    for i, pref in enumerate(["山梨", "長野", "山梨"]):
+        await async_client.post("/api/admin/campsites", json={
+            "name": f"エクスポート{i}",
+            "location": "テスト",
+            "prefecture": pref,
+            "price_min": 1000,
+            "price_max": 2000,
+            "pet_friendly": True,
+            "tags": ["富士山", "絶景"]
+        }, headers=admin_headers)
+
+    # NDJSON（一覧と同じフィルタが使える）
+    resp = await async_client.get("/api/campsites/export", params={"prefecture": "山梨"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [c["name"] for c in lines] == ["エクスポート0", "エクスポート2"]
+    assert lines[0]["tags"] == ["富士山", "絶景"]
+
+    # CSV
+    resp = await async_client.get("/api/campsites/export", params={"format": "csv"})
+    assert resp.status_code == 200
+    rows = list(csv.reader(io.StringIO(resp.text)))
+    assert rows[0][:2] == ["id", "name"]
+    assert len(rows) == 4
+
+@pytest.mark.asyncio
+async def test_campsite_keyword_search(async_client, admin_headers):
+    sites = [
+        ("湖畔キャンプ場", "富士山が見える", "山梨県"),
+        ("富士山キャンプ場", "絶景", "静岡県"),
+        ("森のキャンプ場", "静か", "長野県"),
+        ("富士見台", "士山の文字だけ", "群馬県"),
+    ]
+    for name, description, location in sites:
+        await async_client.post("/api/admin/campsites", json={
+            "name": name,
+            "description": description,
+            "location": location,
+            "prefecture": location[:-1],
+            "price_min": 1000,
+            "price_max": 2000,
+            "pet_friendly": False,
+            "tags": []
+        }, headers=admin_headers)
+
+    # 名前・説明の両方を検索し、gram が揃うだけの行（富士見台）は除外
+    resp = await async_client.get("/api/campsites", params={"keyword": "富士山"})
+    assert [c["name"] for c in resp.json()["items"]] == ["湖畔キャンプ場", "富士山キャンプ場"]
+
+    # 関連度順では名前に含むものが先
+    resp = await async_client.get("/api/campsites", params={"keyword": "富士山", "sort": "relevance", "limit": 1})
+    body = resp.json()
+    assert [c["name"] for c in body["items"]] == ["富士山キャンプ場"]
+    resp = await async_client.get("/api/campsites", params={"keyword": "富士山", "sort": "relevance", "cursor": body["next_cursor"]})
+    assert [c["name"] for c in resp.json()["items"]] == ["湖畔キャンプ場"]
+
+    # 所在地・1文字・複数語
+    resp = await async_client.get("/api/campsites", params={"keyword": "長野"})
+    assert [c["name"] for c in resp.json()["items"]] == ["森のキャンプ場"]
+    resp = await async_client.get("/api/campsites", params={"keyword": "森"})
+    assert [c["name"] for c in resp.json()["items"]] == ["森のキャンプ場"]
+    resp = await async_client.get("/api/campsites", params={"keyword": "キャンプ 静"})
+    assert [c["name"] for c in resp.json()["items"]] == ["富士山キャンプ場", "森のキャンプ場"]
+
+@pytest.mark.asyncio
+async def test_campsite_tag_filter(async_client, admin_headers):
+    sites = [
+        ("絶景サイト", "山梨", True, ["絶景", "富士山"]),
+        ("川辺サイト", "山梨", True, ["川", "絶景"]),
+        ("森サイト", "長野", False, ["森"]),
+    ]
+    for name, pref, pet, tags in sites:
+        await async_client.post("/api/admin/campsites", json={
+            "name": name,
+            "location": pref,
+            "prefecture": pref,
+            "price_min": 1000,
+            "price_max": 2000,
+            "pet_friendly": pet,
+            "tags": tags
+        }, headers=admin_headers)
+
+    resp = await async_client.get("/api/campsites", params={"tag": "絶景", "prefecture": "山梨", "pet_friendly": True})
+    items = resp.json()["items"]
+    assert [c["name"] for c in items] == ["絶景サイト", "川辺サイト"]
+    assert items[0]["tags"] == ["絶景", "富士山"]
+
+    resp = await async_client.get("/api/campsites", params=[("tag", "富士山"), ("tag", "森")])
+    assert [c["name"] for c in resp.json()["items"]] == ["絶景サイト", "森サイト"]
+
+    resp = await async_client.get("/api/campsites", params=[("tag", "絶景"), ("tag", "川"), ("tag_mode", "all")])
+    assert [c["name"] for c in resp.json()["items"]] == ["川辺サイト"]
+
+@pytest.mark.asyncio
+async def test_campsite_nearby(async_client, admin_headers):
+    sites = [
+        ("河口湖キャンプ場", 35.5170, 138.7510),   # 富士山から約18km
+        ("朝霧高原キャンプ場", 35.4030, 138.5870),  # 約14km
+        ("大阪キャンプ場", 34.6937, 135.5023),      # 遠い
+        ("座標なしキャンプ場", None, None),
+    ]
+    for name, lat, lon in sites:
+        await async_client.post("/api/admin/campsites", json={
+            "name": name,
+            "location": "テスト",
+            "prefecture": "テスト",
+            "price_min": 1000,
+            "price_max": 2000,
+            "pet_friendly": True,
+            "tags": [],
+            "latitude": lat,
+            "longitude": lon
+        }, headers=admin_headers)
+
+    resp = await async_client.get("/api/campsites/nearby", params={"lat": 35.3606, "lon": 138.7274, "radius_km": 30})
+    assert resp.status_code == 200
+    items = resp.json()
+    assert [c["name"] for c in items] == ["朝霧高原キャンプ場", "河口湖キャンプ場"]
+    assert 10 < items[0]["distance_km"] < items[1]["distance_km"] < 30
+
+    resp = await async_client.get("/api/campsites/nearby", params={"lat": 35.3606, "lon": 138.7274, "radius_km": 30, "limit": 1})
+    assert [c["name"] for c in resp.json()] == ["朝霧高原キャンプ場"]
+
+    resp = await async_client.get("/api/campsites/nearby", params={"lat": 35.3606, "lon": 138.7274, "radius_km": 5})
+    assert resp.json() == []
+
+@pytest.mark.asyncio
+async def test_campsite_price_filter_and_sort(async_client, admin_headers):
+    sites = [
+        ("Cサイト", 5000, 8000),
+        ("Aサイト", 1000, 2000),
+        ("Bサイト", 3000, 4000),
+        ("Dサイト", 3000, 9000),
+    ]
+    for name, price_min, price_max in sites:
+        await async_client.post("/api/admin/campsites", json={
+            "name": name,
+            "location": "テスト",
+            "prefecture": "テスト",
+            "price_min": price_min,
+            "price_max": price_max,
+            "pet_friendly": True,
+            "tags": []
+        }, headers=admin_headers)
+
+    # 2500〜4500円と料金帯が重なるもの
+    resp = await async_client.get("/api/campsites", params={"price_gte": 2500, "price_lte": 4500})
+    assert [c["name"] for c in resp.json()["items"]] == ["Bサイト", "Dサイト"]
+
+    async def names(sort):
+        result, cursor = [], None
+        while True:
+            params = {"sort": sort, "limit": 1}
+            if cursor:
+                params["cursor"] = cursor
+            body = (await async_client.get("/api/campsites", params=params)).json()
+            result += [c["name"] for c in body["items"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                return result
+
+    assert await names("price_asc") == ["Aサイト", "Bサイト", "Dサイト", "Cサイト"]
+    assert await names("price_desc") == ["Cサイト", "Dサイト", "Bサイト", "Aサイト"]
+    assert await names("name") == ["Aサイト", "Bサイト", "Cサイト", "Dサイト"]
+
+@pytest.mark.asyncio
+async def test_login_rehashes_legacy_password(async_client):
+    await async_client.post("/api/register", json={"username": "legacy", "password": "legacypass"})
+    # 旧形式（sha256）のハッシュに書き戻してからログイン
+    session = await anext(app.dependency_overrides[get_db]())
+    await session.execute(DBUser.__table__.update().values(hashed_password=hashlib.sha256(b"legacypass").hexdigest()))
+    await session.commit()
+
+    resp = await async_client.post("/api/admin/token", data={"username": "legacy", "password": "legacypass"})
+    assert resp.status_code == 200
+    result = await session.execute(DBUser.__table__.select())
+    assert result.fetchone().hashed_password.startswith("$2")
+    await session.close()
+
+    resp = await async_client.post("/api/admin/token", data={"username": "legacy", "password": "wrong"})
+    assert resp.status_code == 401
+
+@pytest.mark.asyncio
+async def test_campsite_fast_serialization_matches_schema(async_client, admin_headers):
+    await async_client.post("/api/admin/campsites", json={
+        "name": "高速キャンプ場",
+        "location": "岐阜県",
+        "prefecture": "岐阜",
+        "price_min": 1000,
+        "price_max": 2000,
+        "pet_friendly": True,
+        "tags": ["川"],
+        "latitude": 35.4,
+        "longitude": 136.7
+    }, headers=admin_headers)
+
+    # 高速パスの JSON は Campsite モデルで検証したものと同じ
+    page = (await async_client.get("/api/campsites")).json()
+    assert page == CampsitePage(**page).dict()
+    detail = (await async_client.get(f"/api/campsites/{page['items'][0]['id']}")).json()
+    assert detail == page["items"][0]
+
+    # OpenAPI のスキーマは response_model のまま
+    schema = (await async_client.get("/openapi.json")).json()
+    ref = schema["paths"]["/api/campsites"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]["$ref"]
+    assert ref.endswith("/CampsitePage")
+
+@pytest.mark.asyncio
+async def test_campsite_conditional_get(async_client, admin_headers):
+    resp = await async_client.post("/api/admin/campsites", json={
+        "name": "ETagキャンプ場",
+        "location": "長野県",
+        "prefecture": "長野",
+        "price_min": 1000,
+        "price_max": 2000,
+        "pet_friendly": False,
+        "tags": []
+    }, headers=admin_headers)
+    campsite_id = resp.json()["id"]
+
+    for url in [f"/api/campsites/{campsite_id}", "/api/campsites"]:
+        resp = await async_client.get(url)
+        etag = resp.headers["etag"]
+        assert "max-age" in resp.headers["cache-control"]
+        resp = await async_client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.content == b""
+
+    detail_etag = (await async_client.get(f"/api/campsites/{campsite_id}")).headers["etag"]
+    list_etag = (await async_client.get("/api/campsites")).headers["etag"]
+    await async_client.patch(f"/api/admin/campsites/{campsite_id}", json={"price_max": 2500}, headers=admin_headers)
+
+    # 更新後は古い ETag では 304 にならない
+    resp = await async_client.get(f"/api/campsites/{campsite_id}", headers={"If-None-Match": detail_etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != detail_etag
+    resp = await async_client.get("/api/campsites", headers={"If-None-Match": list_etag})
+    assert resp.status_code == 200
+    assert resp.json()["items"][0]["price_max"] == 2500
+
+    # キャッシュが空でも version 列だけで 304 を返せる
+    new_etag = (await async_client.get(f"/api/campsites/{campsite_id}")).headers["etag"]
+    await campsite_cache.clear()
+    resp = await async_client.get(f"/api/campsites/{campsite_id}", headers={"If-None-Match": new_etag})
+    assert resp.status_code == 304
+
+    # 削除して作り直すと SQLite は同じ id を使い、version も 1 に戻るが、ETag は一致しない
+    created = (await async_client.post("/api/admin/campsites", json={"name": "再作成", "location": "山梨県", "prefecture": "山梨", "price_min": 1, "price_max": 2, "pet_friendly": True, "tags": []}, headers=admin_headers)).json()
+    first_etag = (await async_client.get(f"/api/campsites/{created['id']}")).headers["etag"]
+    await async_client.delete(f"/api/admin/campsites/{created['id']}", headers=admin_headers)
+    recreated = (await async_client.post("/api/admin/campsites", json={"name": "別物", "location": "山梨県", "prefecture": "山梨", "price_min": 1, "price_max": 2, "pet_friendly": True, "tags": []}, headers=admin_headers)).json()
+    assert recreated["id"] == created["id"]
+    await campsite_cache.clear()
+    resp = await async_client.get(f"/api/campsites/{created['id']}", headers={"If-None-Match": first_etag})
+    assert resp.status_code == 200
+    assert resp.json()["name"] == "別物"
+
+@pytest.mark.asyncio
+async def test_campsite_facets(async_client, admin_headers):
+    data = [
+        ("A", "長野", True, ["川", "温泉"]),
+        ("B", "長野", False, ["川"]),
+        ("C", "山梨", True, ["温泉"]),
+    ]
+    ids = []
+    for name, prefecture, pet, tags in data:
+        resp = await async_client.post("/api/admin/campsites", json={
+            "name": name, "location": prefecture, "prefecture": prefecture,
+            "price_min": 1000, "price_max": 2000, "pet_friendly": pet, "tags": tags
+        }, headers=admin_headers)
+        ids.append(resp.json()["id"])
+
+    facets = (await async_client.get("/api/campsites/facets")).json()
+    assert facets == {
+        "total": 3,
+        "prefecture": {"長野": 2, "山梨": 1},
+        "pet_friendly": {"true": 2, "false": 1},
+        "tag": {"川": 2, "温泉": 2},
+    }
+    # 絞り込みありは条件に一致する行だけを数える
+    facets = (await async_client.get("/api/campsites/facets", params={"tag": "川"})).json()
+    assert facets["total"] == 2
+    assert facets["prefecture"] == {"長野": 2}
+
+    # 更新・一括更新・削除でサマリが差分更新される
+    await async_client.patch(f"/api/admin/campsites/{ids[1]}", json={"prefecture": "山梨", "tags": ["湖"]}, headers=admin_headers)
+    await async_client.post("/api/admin/campsites/bulk-update", json={"ids": [ids[0]], "changes": {"pet_friendly": False}}, headers=admin_headers)
+    await async_client.delete(f"/api/admin/campsites/{ids[2]}", headers=admin_headers)
+    facets = (await async_client.get("/api/campsites/facets")).json()
+    expected = {
+        "total": 2,
+        "prefecture": {"山梨": 1, "長野": 1},
+        "pet_friendly": {"false": 2},
+        "tag": {"温泉": 1, "川": 1, "湖": 1},
+    }
+    assert facets == expected
+
+    # 全件からの再集計と一致する
+    await async_client.post("/api/admin/facets/rebuild", headers=admin_headers)
+    assert (await async_client.get("/api/campsites/facets")).json() == expected
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(async_client, admin_headers):
+    metrics.clear()
+    resp = await async_client.post("/api/admin/campsites", json={
+        "name": "計測キャンプ場", "location": "長野県", "prefecture": "長野",
+        "price_min": 1000, "price_max": 2000, "pet_friendly": True, "tags": ["川"]
+    }, headers=admin_headers)
+    campsite_id = resp.json()["id"]
+    await async_client.get(f"/api/campsites/{campsite_id}")
+    await async_client.get("/api/campsites/999999")
+    await async_client.get("/no-such-path")
+
+    resp = await async_client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    lines = resp.text.splitlines()
+    # ルートはパスのテンプレートで集計される
+    route = 'method="GET",route="/api/campsites/{campsite_id}"'
+    assert f'http_requests_total{{{route},status="200"}} 1' in lines
+    assert f'http_requests_total{{{route},status="404"}} 1' in lines
+    assert f'http_request_duration_seconds_count{{{route}}} 2' in lines
+    assert f'http_request_duration_seconds_bucket{{{route},le="+Inf"}} 2' in lines
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in lines
+    # リクエスト中に実行された SQL が数えられている
+    queries = [l for l in lines if l.startswith(f"http_request_db_queries_total{{{route}}}")]
+    assert int(queries[0].rsplit(" ", 1)[1]) >= 2
+    assert "http_requests_in_flight 0" in lines
+
+@pytest.mark.asyncio
+async def test_campsite_batch(async_client, admin_headers, query_counter):
+    ids = []
+    for i in range(3):
+        resp = await async_client.post("/api/admin/campsites", json={
+            "name": f"まとめ{i}", "location": "静岡県", "prefecture": "静岡",
+            "price_min": 1000, "price_max": 2000, "pet_friendly": True, "tags": [f"タグ{i}"]
+        }, headers=admin_headers)
+        ids.append(resp.json()["id"])
+
+    query_counter.reset()
+    resp = await async_client.post("/api/campsites/batch", json={"ids": [ids[2], 999999, ids[0], ids[2], ids[1]]})
+    assert resp.status_code == 200
+    body = resp.json()
+    # 要求順（重複は1件）で返し、見つからない id は missing に入る
+    assert [c["id"] for c in body["items"]] == [ids[2], ids[0], ids[1]]
+    assert body["items"][0]["tags"] == ["タグ2"]
+    assert body["missing"] == [999999]
+    # 本体とタグの2クエリだけ
+    assert query_counter.count == 2
+
+    # 詳細キャッシュに載るので、2回目は DB に行かない
+    query_counter.reset()
+    resp = await async_client.post("/api/campsites/batch", json={"ids": ids})
+    assert [c["id"] for c in resp.json()["items"]] == ids
+    assert query_counter.count == 0
+
+    resp = await async_client.post("/api/campsites/batch", json={"ids": list(range(1, 1000))})
+    assert resp.status_code == 400
+
+@pytest.mark.asyncio
+async def test_campsite_loader_coalesces(async_client, admin_headers):
+    resp = await async_client.post("/api/admin/campsites", json={
+        "name": "ローダー", "location": "静岡県", "prefecture": "静岡",
+        "price_min": 1000, "price_max": 2000, "pet_friendly": True, "tags": []
+    }, headers=admin_headers)
+    campsite_id = resp.json()["id"]
+    await campsite_cache.clear()
+
+    session = await anext(app.dependency_overrides[get_db]())
+    loader = CampsiteLoader(session)
+    # 同時に要求された同じ id は1つの Future を共有し、1回のバッチで読まれる
+    results = await asyncio.gather(loader.load(campsite_id), loader.load(campsite_id), loader.load(424242))
+    assert results[0] is results[1]
+    assert results[2] is None
+    assert loader.batches == 1
+    await session.close()
+
+@pytest.mark.asyncio
+async def test_campsite_sparse_fields(async_client, admin_headers, query_counter):
+    resp = await async_client.post("/api/admin/campsites", json={
+        "name": "地図用", "description": "長い説明" * 100, "location": "熊本県", "prefecture": "熊本",
+        "price_min": 1500, "price_max": 3000, "pet_friendly": True, "tags": ["阿蘇"]
+    }, headers=admin_headers)
+    campsite_id = resp.json()["id"]
+
+    query_counter.reset()
+    resp = await async_client.get("/api/campsites", params={"fields": "name,prefecture,price_min", "sort": "price_asc"})
+    assert resp.json()["items"] == [{"id": campsite_id, "name": "地図用", "prefecture": "熊本", "price_min": 1500}]
+    # 説明は SELECT せず、タグも読まない
+    assert not any("description" in s for s in query_counter.statements if s.lstrip().startswith("SELECT campsites"))
+    assert not any("campsite_tags" in s for s in query_counter.statements)
+
+    resp = await async_client.get(f"/api/campsites/{campsite_id}", params={"fields": "tags,name"})
+    assert resp.json() == {"id": campsite_id, "name": "地図用", "tags": ["阿蘇"]}
+    sparse_etag = resp.headers["etag"]
+    full = await async_client.get(f"/api/campsites/{campsite_id}")
+    assert full.headers["etag"] != sparse_etag
+    assert "description" in full.json()
+
+    resp = await async_client.get("/api/campsites", params={"fields": "name,secret"})
+    assert resp.status_code == 400
+
+    # 更新するとフィールド指定付きの詳細キャッシュも消える
+    await async_client.patch(f"/api/admin/campsites/{campsite_id}", json={"name": "地図用2"}, headers=admin_headers)
+    resp = await async_client.get(f"/api/campsites/{campsite_id}", params={"fields": "name,tags"})
+    assert resp.json()["name"] == "地図用2"
@@ -0,0 +1,65 @@
+import pytest
+
+# ルートごとの SQL 文の上限（1リクエストあたり）。往復が増えたらここで検知する
+# 管理APIはトークンのユーザー確認がキャッシュ済みの状態で数える
+BUDGETS = {
+    ("POST", "/api/register"): 1,
+    ("GET", "/api/campsites"): 3,
+    ("GET", "/api/campsites/{campsite_id}"): 2,
+    ("GET", "/api/campsites/facets"): 3,
+    ("POST", "/api/admin/campsites"): 9,
+    ("PUT", "/api/admin/campsites/{campsite_id}"): 11,
+    ("PATCH", "/api/admin/campsites/{campsite_id}"): 11,
+    ("DELETE", "/api/admin/campsites/{campsite_id}"): 10,
+}
+
+CAMPSITE = {
+    "name": "予算キャンプ場",
+    "description": "湖のそばのキャンプ場",
+    "location": "長野県",
+    "prefecture": "長野",
+    "price_min": 1000,
+    "price_max": 2000,
+    "pet_friendly": True,
+    "tags": ["湖", "星空"],
+}
+
+async def request_within_budget(client, query_counter, method, route, url, **kwargs):
+    query_counter.reset()
+    resp = await client.request(method, url, **kwargs)
+    budget = BUDGETS[(method, route)]
+    assert query_counter.count <= budget, f"{method} {route}: {query_counter.count} statements (budget {budget})\n" + "\n".join(query_counter.statements)
+    return resp
+
+@pytest.mark.asyncio
+async def test_query_budgets(async_client, admin_headers, query_counter):
+    # 認証済みユーザーをキャッシュに載せておく
+    await async_client.get("/api/admin/cache/stats", headers=admin_headers)
+    check = lambda method, route, url, **kw: request_within_budget(async_client, query_counter, method, route, url, **kw)
+
+    resp = await check("POST", "/api/register", "/api/register", json={"username": "budget", "password": "budgetpass"})
+    assert resp.status_code == 200
+    resp = await check("POST", "/api/register", "/api/register", json={"username": "budget", "password": "budgetpass"})
+    assert resp.status_code == 400
+
+    resp = await check("POST", "/api/admin/campsites", "/api/admin/campsites", json=CAMPSITE, headers=admin_headers)
+    assert resp.status_code == 200
+    campsite_id = resp.json()["id"]
+    url = f"/api/admin/campsites/{campsite_id}"
+
+    resp = await check("PUT", "/api/admin/campsites/{campsite_id}", url, json=dict(CAMPSITE, price_max=2500), headers=admin_headers)
+    assert resp.json()["price_max"] == 2500
+    resp = await check("PATCH", "/api/admin/campsites/{campsite_id}", url, json={"pet_friendly": False}, headers=admin_headers)
+    assert resp.json()["pet_friendly"] is False
+    resp = await check("PUT", "/api/admin/campsites/{campsite_id}", "/api/admin/campsites/999999", json=CAMPSITE, headers=admin_headers)
+    assert resp.status_code == 404
+
+    await check("GET", "/api/campsites", "/api/campsites", params={"prefecture": "長野"})
+    resp = await check("GET", "/api/campsites/{campsite_id}", f"/api/campsites/{campsite_id}")
+    assert resp.json()["tags"] == ["湖", "星空"]
+    await check("GET", "/api/campsites/facets", "/api/campsites/facets", params={"prefecture": "長野"})
+
+    resp = await check("DELETE", "/api/admin/campsites/{campsite_id}", url, headers=admin_headers)
+    assert resp.status_code == 200
+    resp = await check("DELETE", "/api/admin/campsites/{campsite_id}", url, headers=admin_headers)
+    assert resp.status_code == 404
@@ -0,0 +1,79 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert, select, text
+from app.main import app
+from app.database.base import Base
+from app.database.session import ReplicaRouter, engines, get_db, get_engine, get_read_db, get_session_maker
+
+@pytest_asyncio.fixture(autouse=True)
+async def dispose_test_engines():
+    # get_engine は engines に登録する（/api/admin/db/pool に出る）ので、テストで作った分は閉じて外す
+    before = set(engines)
+    yield
+    for name in set(engines) - before:
+        await engines.pop(name).dispose()
+
+async def _make_db(path, label):
+    engine = get_engine(f"sqlite+aiosqlite:///{path}", name=f"test-{label}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE source (label TEXT)"))
+        await conn.execute(text("INSERT INTO source VALUES (:label)"), {"label": label})
+    return engine
+
+async def _read(router):
+    async for session in router.session():
+        return (await session.execute(text("SELECT label FROM source"))).scalar()
+
+@pytest.mark.asyncio
+async def test_replica_round_robin_and_fallback(tmp_path):
+    primary = await _make_db(tmp_path / "primary.db", "primary")
+    replica1 = await _make_db(tmp_path / "replica1.db", "replica1")
+    replica2 = await _make_db(tmp_path / "replica2.db", "replica2")
+    router = ReplicaRouter(get_session_maker(primary), [get_session_maker(replica1), get_session_maker(replica2)])
+
+    # レプリカを順番に使う
+    assert [await _read(router) for _ in range(4)] == ["replica1", "replica2", "replica1", "replica2"]
+
+    # 接続できないレプリカは外してプライマリへ
+    broken = get_engine(f"sqlite+aiosqlite:///{tmp_path}/missing/dir.db", name="test-broken")
+    router = ReplicaRouter(get_session_maker(primary), [get_session_maker(broken)], retry_seconds=60)
+    assert await _read(router) == "primary"
+    assert "replica1" in router.down_until
+    assert await _read(router) == "primary"
+
+async def _snapshot(source, engine):
+    # プライマリの今の内容をレプリカ用の DB に写す（この後の書き込みは反映されない＝遅れているレプリカ）
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for table in Base.metadata.sorted_tables:
+            rows = [dict(r._mapping) for r in await source.execute(select(table))]
+            if rows:
+                await conn.execute(insert(table), rows)
+
+@pytest.mark.asyncio
+async def test_lagging_replica_does_not_refill_cache(async_client, admin_headers, tmp_path):
+    resp = await async_client.post("/api/admin/campsites", json={"name": "変更前", "location": "長野県", "prefecture": "長野", "price_min": 1000, "price_max": 2000, "pet_friendly": True, "tags": []}, headers=admin_headers)
+    campsite_id = resp.json()["id"]
+    replica = get_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}", name="test-lagging")
+    primary = await anext(app.dependency_overrides[get_db]())
+    await _snapshot(primary, replica)
+    await primary.close()
+    replica_maker = get_session_maker(replica)
+
+    async def lagging_read_db():
+        async with replica_maker() as session:
+            yield session
+
+    await async_client.patch(f"/api/admin/campsites/{campsite_id}", json={"name": "変更後"}, headers=admin_headers)
+    app.dependency_overrides[get_read_db] = lagging_read_db
+    try:
+        # 遅れているレプリカからは古い内容が返るが、キャッシュには載らない
+        assert (await async_client.get(f"/api/campsites/{campsite_id}")).json()["name"] == "変更前"
+        assert (await async_client.get("/api/campsites")).json()["items"][0]["name"] == "変更前"
+        assert (await async_client.post("/api/campsites/batch", json={"ids": [campsite_id]})).json()["items"][0]["name"] == "変更前"
+    finally:
+        app.dependency_overrides.pop(get_read_db, None)
+    # レプリカが追いついた（ここではプライマリから読む）後は新しい内容になる
+    assert (await async_client.get(f"/api/campsites/{campsite_id}")).json()["name"] == "変更後"
+    assert (await async_client.get("/api/campsites")).json()["items"][0]["name"] == "変更後"
+    assert (await async_client.post("/api/campsites/batch", json={"ids": [campsite_id]})).json()["items"][0]["name"] == "変更後"
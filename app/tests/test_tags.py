@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.database.base import Base
+from app.migrations.backfill_tags import backfill_tags, drop_legacy_column, has_legacy_column, main
+from app.models.campsite import DBCampsite
+from app.models.facet import DBCampsiteFacet
+from app.models.tag import DBTag
+from app.core.tags import get_tag_ids, load_tags
+
+@pytest.mark.asyncio
+async def test_concurrent_new_tags(tmp_path):
+    # 同じ新しいタグを同時に作っても一意制約違反にならず、両方が同じ id を受け取る
+    # （インメモリ DB は接続を共有するので、別々の接続を持てるファイルの DB で試す）
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'tags.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def resolve(names):
+        async with maker() as db:
+            ids = await get_tag_ids(db, names)
+            # 読み取りから書き込みまでの間に相手の書き込みが入り込む余地を作る
+            await asyncio.sleep(0.05)
+            await db.commit()
+            return ids
+
+    first, second = await asyncio.gather(resolve(["湖", "星空"]), resolve(["星空", "森"]))
+    assert first["星空"] == second["星空"]
+    async with maker() as db:
+        assert sorted((await db.execute(select(DBTag.name))).scalars()) == sorted(["湖", "星空", "森"])
+    await engine.dispose()
+
+async def _legacy_database(path):
+    # タグをまだカンマ区切りで持っている旧スキーマの DB
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text("ALTER TABLE campsites ADD COLUMN tags VARCHAR"))
+        await conn.execute(insert(DBCampsite), [
+            {"id": i, "name": f"旧{i}", "location": "長野県", "prefecture": "長野", "price_min": 1000, "price_max": 2000, "pet_friendly": True}
+            for i in range(1, 5)
+        ])
+        await conn.execute(text("UPDATE campsites SET tags = :tags WHERE id = :id"), [
+            {"id": 1, "tags": "湖, 星空,湖"}, {"id": 2, "tags": "星空," + "x" * 65}, {"id": 3, "tags": ""}, {"id": 4, "tags": None},
+        ])
+    return engine
+
+async def _create_legacy_database(path):
+    await (await _legacy_database(path)).dispose()
+
+@pytest.mark.asyncio
+async def test_backfill_tags(tmp_path):
+    engine = await _legacy_database(tmp_path / "legacy.db")
+    maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with maker() as db:
+        assert await backfill_tags(db, batch_size=1) == {"campsites": 2, "skipped_tags": 1}
+        assert await load_tags(db, [1, 2, 3, 4]) == {1: ["湖", "星空"], 2: ["星空"], 3: [], 4: []}
+        facets = {(r.facet, r.value): r.count for r in (await db.execute(select(DBCampsiteFacet))).scalars()}
+        assert facets[("tag", "星空")] == 2
+        # 2回目は移行済みの行を飛ばす
+        assert await backfill_tags(db) == {"campsites": 0, "skipped_tags": 0}
+        assert await load_tags(db, [1]) == {1: ["湖", "星空"]}
+        assert await drop_legacy_column(db)
+        assert not await has_legacy_column(db)
+        assert await backfill_tags(db) == {"campsites": 0, "skipped_tags": 0}
+    await engine.dispose()
+
+def test_backfill_tags_cli(tmp_path):
+    path = tmp_path / "legacy.db"
+    asyncio.run(_create_legacy_database(path))
+    main(["--database-url", f"sqlite+aiosqlite:///{path}", "--drop-column"])
+
+    async def check():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with maker() as db:
+            assert not await has_legacy_column(db)
+            assert (await load_tags(db, [2]))[2] == ["星空"]
+        await engine.dispose()
+    asyncio.run(check())